@@ -0,0 +1,57 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from miyuki.utils import concat_files
+
+
+def create_segments(folder: str, total_bytes: int, segment_size: int) -> list[str]:
+    block = os.urandom(segment_size)
+    files = []
+    for i in range(total_bytes // segment_size):
+        file_path = os.path.join(folder, f"video{i}.jpeg")
+        with open(file_path, 'wb') as f:
+            f.write(block)
+        files.append(file_path)
+    return files
+
+
+def legacy_concat(output_file: str, folder: str, count: int) -> None:
+    with open(output_file, 'wb') as outfile:
+        for i in range(count):
+            file_path = os.path.join(folder, f"video{i}.jpeg")
+            if os.path.exists(file_path):
+                with open(file_path, 'rb') as infile:
+                    outfile.write(infile.read())
+
+
+def run(name: str, func, total_bytes: int) -> None:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8} {elapsed:8.3f}s {total_bytes / elapsed / 1024 / 1024:10.1f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare segment concatenation throughput.')
+    parser.add_argument('-size', type=int, default=2048, help='Total size of the synthetic segment set in MB')
+    parser.add_argument('-segment', type=int, default=512, help='Segment size in KB')
+    parser.add_argument('-dir', type=str, default=None, help='Working directory (defaults to a temporary directory)')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(dir=args.dir)
+    try:
+        files = create_segments(folder, args.size * 1024 * 1024, args.segment * 1024)
+        total_bytes = len(files) * args.segment * 1024
+        print(f"{len(files)} segments, {total_bytes / 1024 / 1024:.0f} MB")
+        output_file = os.path.join(folder, 'output.mp4')
+        run('legacy', lambda: legacy_concat(output_file, folder, len(files)), total_bytes)
+        os.remove(output_file)
+        run('concat', lambda: concat_files(output_file, files), total_bytes)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
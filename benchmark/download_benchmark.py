@@ -0,0 +1,172 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+from benchmark.mock_server import MockMissAV
+from miyuki.buffer_pool import BufferPool, PooledBuffer
+from miyuki.config import MOVIE_SAVE_PATH_ROOT
+from miyuki.http_client import HttpClient, AsyncHttpClient
+from miyuki.logger import logger, file_handler
+from miyuki.m3u8_parser import Segment
+from miyuki.url_sources import PlaylistSource
+from miyuki.utils import ThreadSafeCounter, ConnectionBudget, peak_rss
+from miyuki.video_downloader import VideoDownloader
+
+
+# Segment latency as the downloader sees it, including retries and buffer waits.
+class TimedDownloader(VideoDownloader):
+    def __init__(self, *args, latencies: list[float], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = latencies
+
+    def _get_segment(self, segment: Segment, cancelled: Optional[threading.Event] = None) -> Optional[PooledBuffer]:
+        start = time.perf_counter()
+        content = super()._get_segment(segment, cancelled)
+        if content is not None:
+            self.latencies.append(time.perf_counter() - start)
+        return content
+
+    async def _async_get_segment(self, client: AsyncHttpClient, segment: Segment) -> Optional[PooledBuffer]:
+        start = time.perf_counter()
+        content = await super()._async_get_segment(client, segment)
+        if content is not None:
+            self.latencies.append(time.perf_counter() - start)
+        return content
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_sources(server: MockMissAV) -> dict:
+    start = time.perf_counter()
+    urls = PlaylistSource(ThreadSafeCounter(), server.playlist_url(), None).get_urls()
+    elapsed = time.perf_counter() - start
+    return {
+        'urls': len(urls),
+        'seconds': round(elapsed, 4),
+        'urls_per_second': round(len(urls) / elapsed, 2) if elapsed else None,
+    }
+
+
+def bench_downloads(server: MockMissAV, urls: list[str], options: dict, pool_size: int) -> dict:
+    http_client = HttpClient(pool_size=pool_size)
+    budget = ConnectionBudget(pool_size)
+    buffers = BufferPool()
+    server.segment_latencies.clear()
+    latencies = []
+    completed = 0
+    segments = 0
+    total_bytes = 0
+    start = time.perf_counter()
+    for url in urls:
+        downloader = TimedDownloader(url, http_client, options, budget, buffers, latencies=latencies)
+        downloader.m3u8_prefix = server.url
+        downloader.clean()
+        try:
+            downloader.download()
+        except Exception as e:
+            logger.error(f"Benchmark download failed for {url}: {e}")
+        downloader.clean()
+        segments += downloader.metrics.segments_downloaded.get()
+        total_bytes += downloader.metrics.bytes.get()
+        output_file = os.path.join(MOVIE_SAVE_PATH_ROOT, f"{downloader.final_file_name}.mp4")
+        if downloader.final_file_name and os.path.exists(output_file):
+            completed += os.path.getsize(output_file) == server.segments * server.segment_size
+            os.remove(output_file)
+    elapsed = time.perf_counter() - start
+    stats = http_client.stats()
+    http_client.close()
+    return {
+        'movies': len(urls),
+        'completed': completed,
+        'seconds': round(elapsed, 4),
+        'segments': segments,
+        'segments_per_second': round(segments / elapsed, 2),
+        'mb_per_second': round(total_bytes / elapsed / 1024 / 1024, 2),
+        'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'server_latency_p50_ms': round(percentile(server.segment_latencies, 0.50) * 1000, 2),
+        'server_latency_p99_ms': round(percentile(server.segment_latencies, 0.99) * 1000, 2),
+        'buffer_high_water_mb': round(buffers.high_water / 1024 / 1024, 2),
+        'connections_opened': stats['connections_opened'],
+        'requests_served': stats['requests_served'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the downloader end to end against a local mock MissAV/surrit server.')
+    parser.add_argument('-movies', type=int, default=2, help='Number of movies to download')
+    parser.add_argument('-listed', type=int, default=240, help='Number of movies in the paginated playlist (12 per page)')
+    parser.add_argument('-segments', type=int, default=200, help='Segments per movie')
+    parser.add_argument('-segment', type=int, default=512, help='Segment size in KB')
+    parser.add_argument('-latency', type=float, default=20, help='Added latency per segment request in ms')
+    parser.add_argument('-bandwidth', type=int, default=0, help='Per-connection bandwidth in KB/s (0 for unlimited)')
+    parser.add_argument('-errors', type=float, default=0.0, help='Fraction of segment requests answered with 503')
+    parser.add_argument('-workers', type=int, default=16, help='Concurrent segment downloads per movie')
+    parser.add_argument('-engine', type=str, choices=['thread', 'async'], default='thread', help='Segment download engine')
+    parser.add_argument('-output', type=str, default=None, help='Also write the JSON report to this file')
+    parser.add_argument('-dir', type=str, default=None, help='Working directory (defaults to a temporary directory)')
+    parser.add_argument('-verbose', action='store_true', help='Keep the downloader log output')
+    args = parser.parse_args()
+
+    # Keep benchmark runs from appending to miyuki.log in the invocation directory.
+    logger.removeHandler(file_handler)
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+    server = MockMissAV(segments=args.segments, segment_size=args.segment * 1024, latency=args.latency / 1000,
+                        bandwidth=args.bandwidth * 1024, error_rate=args.errors, movies=args.listed).start()
+    options = {
+        'download_action': True,
+        'write_action': True,
+        'ffmpeg_action': False,
+        'num_workers': args.workers,
+        'engine': args.engine,
+        'progress': False,
+        'retry': 5,
+        'delay': 0,
+        'timeout': 30,
+    }
+    output_file = os.path.abspath(args.output) if args.output else None
+    folder = tempfile.mkdtemp(dir=args.dir)
+    cwd = os.getcwd()
+    try:
+        os.chdir(folder)
+        os.makedirs(MOVIE_SAVE_PATH_ROOT, exist_ok=True)
+        sources = bench_sources(server)
+        downloads = bench_downloads(server, [server.movie_url(i) for i in range(args.movies)], options, max(16, args.workers))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder, ignore_errors=True)
+        server.stop()
+    rss = peak_rss()
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'dir', 'verbose')},
+        'sources': sources,
+        'downloads': downloads,
+        'errors_injected': server.errors_injected,
+        'peak_rss_mb': round(rss / 1024 / 1024, 2) if rss else None,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    if downloads['completed'] != downloads['movies']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+import hashlib
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+RESOLUTIONS = [(640, 360), (1280, 720), (1920, 1080)]
+CHUNK_SIZE = 64 * 1024
+LISTEN_BACKLOG = 1024
+
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops concurrent connects into 1 s SYN retransmits.
+    request_queue_size = LISTEN_BACKLOG
+    daemon_threads = True
+
+
+class MockMissAV:
+    def __init__(self, segments: int = 200, segment_size: int = 512 * 1024, latency: float = 0.0,
+                 bandwidth: int = 0, error_rate: float = 0.0, movies: int = 24, per_page: int = 12, seed: int = 0):
+        self.segments = segments
+        self.segment_size = segment_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.movies = movies
+        self.per_page = per_page
+        self.segment_latencies = []
+        self.errors_injected = 0
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._segment_cache = {}
+        self._server = _Server(('127.0.0.1', 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/"
+
+    @staticmethod
+    def uuid(movie: str) -> str:
+        digest = hashlib.sha1(movie.encode()).hexdigest()[:12]
+        return f"{digest[:8]}-{digest[8:]}"
+
+    def movie_url(self, i: int) -> str:
+        return f"{self.url}movie-{i}"
+
+    def playlist_url(self) -> str:
+        return f"{self.url}list"
+
+    def start(self) -> 'MockMissAV':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def segment(self, index: int) -> bytes:
+        content = self._segment_cache.get(index % 256)
+        if content is None:
+            content = bytes([index % 256]) * self.segment_size
+            self._segment_cache[index % 256] = content
+        return content
+
+    def _movie_page(self, movie: str) -> bytes:
+        first, second = self.uuid(movie).split('-')
+        return (f'<html><head><title>{movie} synthetic title</title></head><body>'
+                f'<script>eval("m3u8|{second}|{first}|com|surrit|https|video")</script></body></html>').encode()
+
+    def _list_page(self, page: int) -> bytes:
+        pages = max(1, -(-self.movies // self.per_page))
+        start = (page - 1) * self.per_page
+        links = ''.join(f'<a href="{self.movie_url(i)}" alt="movie-{i}">' for i in range(start, min(start + self.per_page, self.movies)))
+        pagination = ''.join(f'<a href="{self.playlist_url()}?page={n}">{n}</a>' for n in range(1, min(pages, 5) + 1))
+        if page < pages:
+            pagination += f'<a href="{self.playlist_url()}?page={page + 1}" rel="next">'
+        return f'<html><body>{links}{pagination}</body></html>'.encode()
+
+    def _master_playlist(self) -> bytes:
+        lines = ['#EXTM3U']
+        for width, height in RESOLUTIONS:
+            lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={width * height},RESOLUTION={width}x{height}')
+            lines.append(f'{height}p/video.m3u8')
+        return ('\n'.join(lines) + '\n').encode()
+
+    def _media_playlist(self) -> bytes:
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:4', '#EXT-X-MEDIA-SEQUENCE:0']
+        for i in range(self.segments):
+            lines.append('#EXTINF:4.000000,')
+            lines.append(f'video{i}.jpeg')
+        lines.append('#EXT-X-ENDLIST')
+        return ('\n'.join(lines) + '\n').encode()
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors_injected += 1
+                return True
+        return False
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send(self, status: int, body: bytes, headers: Optional[dict] = None, throttle: bool = False) -> None:
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command == 'HEAD':
+                    return
+                if not throttle or not server.bandwidth:
+                    self.wfile.write(body)
+                    return
+                for start in range(0, len(body), CHUNK_SIZE):
+                    chunk = body[start:start + CHUNK_SIZE]
+                    self.wfile.write(chunk)
+                    time.sleep(len(chunk) / server.bandwidth)
+
+            def _segment(self, index: int) -> None:
+                started = time.perf_counter()
+                if server.latency:
+                    time.sleep(server.latency)
+                if server._should_fail():
+                    self._send(503, b'unavailable', {'Retry-After': '0'})
+                    return
+                body = server.segment(index)
+                status = 200
+                headers = {}
+                range_header = self.headers.get('Range')
+                if range_header:
+                    start, end = range_header.split('=', 1)[1].split('-')
+                    end = int(end) if end else len(body) - 1
+                    headers['Content-Range'] = f"bytes {start}-{end}/{len(body)}"
+                    body = body[int(start):end + 1]
+                    status = 206
+                self._send(status, body, headers, throttle=True)
+                if self.command == 'GET':
+                    with server._lock:
+                        server.segment_latencies.append(time.perf_counter() - started)
+
+            def do_HEAD(self) -> None:
+                self.do_GET()
+
+            def do_GET(self) -> None:
+                path, _, query = self.path.partition('?')
+                segment = re.fullmatch(r'/[0-9a-f-]+/\d+p/video(\d+)\.jpeg', path)
+                if segment:
+                    self._segment(int(segment.group(1)))
+                elif path.endswith('/playlist.m3u8'):
+                    self._send(200, server._master_playlist())
+                elif path.endswith('/video.m3u8'):
+                    self._send(200, server._media_playlist())
+                elif path == '/list':
+                    time.sleep(server.latency)
+                    page = re.search(r'page=(\d+)', query)
+                    self._send(200, server._list_page(int(page.group(1)) if page else 1))
+                elif path.startswith('/movie-'):
+                    self._send(200, server._movie_page(path[1:]))
+                else:
+                    self._send(404, b'not found')
+
+        return Handler
@@ -0,0 +1,139 @@
+import threading
+from collections import deque
+from typing import Optional
+from miyuki.config import SEGMENT_BUFFER_BUDGET, SEGMENT_BUFFER_HINT, SEGMENT_BUFFER_HINT_WINDOW
+from miyuki.utils import AsyncWaiters
+
+
+class BufferBudgetExceeded(Exception):
+    def __init__(self, size: int):
+        super().__init__(f"Segment buffer needs {size} bytes, more than the buffer budget has free")
+        self.size = size
+
+
+class PooledBuffer:
+    __slots__ = ('pool', 'data', 'size')
+
+    def __init__(self, pool: 'BufferPool', data: bytearray):
+        self.pool = pool
+        self.data = data
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def write(self, chunk: bytes) -> int:
+        end = self.size + len(chunk)
+        if end > len(self.data) and not self.pool._grow(self, end):
+            # Aborts the transfer; the caller reserves the larger size and fetches the body again.
+            raise BufferBudgetExceeded(max(end, len(self.data) * 2))
+        self.data[self.size:end] = chunk
+        self.size = end
+        return len(chunk)
+
+    def clear(self) -> None:
+        self.size = 0
+
+    def view(self) -> memoryview:
+        return memoryview(self.data)[:self.size]
+
+    def release(self) -> None:
+        if self.data is not None:
+            self.pool._release(self)
+
+
+class BufferPool:
+    def __init__(self, max_bytes: int = SEGMENT_BUFFER_BUDGET):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.high_water = 0
+        self.size_hint = SEGMENT_BUFFER_HINT
+        self._recent_sizes = deque(maxlen=SEGMENT_BUFFER_HINT_WINDOW)
+        self._retained = 0
+        self._free = []
+        self._condition = threading.Condition()
+        self._waiters = AsyncWaiters()
+
+    def _can_reserve(self, size: int) -> bool:
+        return self.in_flight == 0 or self.in_flight + size <= self.max_bytes
+
+    def _take(self, size: int) -> bytearray:
+        for i, data in enumerate(self._free):
+            if len(data) >= size:
+                del self._free[i]
+                break
+        else:
+            while self._free and self._retained + size > self.max_bytes:
+                self._retained -= len(self._free.pop(0))
+            data = bytearray(size)
+            self._retained += size
+        self.in_flight += len(data)
+        self.high_water = max(self.high_water, self.in_flight)
+        return data
+
+    def acquire(self, size: Optional[int] = None) -> PooledBuffer:
+        size = size or self.size_hint
+        with self._condition:
+            self._condition.wait_for(lambda: self._can_reserve(size))
+            return PooledBuffer(self, self._take(size))
+
+    def try_acquire(self, size: Optional[int] = None) -> Optional[PooledBuffer]:
+        size = size or self.size_hint
+        with self._condition:
+            return PooledBuffer(self, self._take(size)) if self._can_reserve(size) else None
+
+    async def async_acquire(self, size: Optional[int] = None) -> PooledBuffer:
+        buffer = PooledBuffer(self, None)
+        await self._waiters.wait_for(lambda: self._try_take(buffer, size or self.size_hint))
+        return buffer
+
+    def _grow(self, buffer: PooledBuffer, size: int) -> bool:
+        with self._condition:
+            alone = self.in_flight == len(buffer.data)
+            for target in (max(size, len(buffer.data) * 2), size):
+                extra = target - len(buffer.data)
+                if alone or self.in_flight + extra <= self.max_bytes:
+                    break
+            else:
+                return False
+            buffer.data.extend(bytes(extra))
+            self.in_flight += extra
+            self._retained += extra
+            self.high_water = max(self.high_water, self.in_flight)
+            return True
+
+    def _return(self, buffer: PooledBuffer) -> None:
+        self.in_flight -= len(buffer.data)
+        self._free.append(buffer.data)
+        self._free.sort(key=len)
+        buffer.data = None
+        buffer.size = 0
+        self._condition.notify_all()
+        self._waiters.notify()
+
+    def resize(self, buffer: PooledBuffer, size: int) -> None:
+        with self._condition:
+            self._return(buffer)
+            self._condition.wait_for(lambda: self._can_reserve(size))
+            buffer.data = self._take(size)
+
+    async def async_resize(self, buffer: PooledBuffer, size: int) -> None:
+        with self._condition:
+            self._return(buffer)
+        await self._waiters.wait_for(lambda: self._try_take(buffer, size))
+
+    def _try_take(self, buffer: PooledBuffer, size: int) -> bool:
+        with self._condition:
+            if not self._can_reserve(size):
+                return False
+            buffer.data = self._take(size)
+            return True
+
+    def record_size(self, size: int) -> None:
+        with self._condition:
+            self._recent_sizes.append(size)
+            self.size_hint = max(self._recent_sizes)
+
+    def _release(self, buffer: PooledBuffer) -> None:
+        with self._condition:
+            self._return(buffer)
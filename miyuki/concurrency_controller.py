@@ -0,0 +1,103 @@
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+from miyuki.config import ADAPTIVE_INITIAL_WINDOW, ADAPTIVE_INTERVAL, ADAPTIVE_TOLERANCE
+from miyuki.logger import logger
+from miyuki.utils import AsyncWaiters
+
+
+class ConcurrencyController:
+    def __init__(self, maximum: int, adaptive: bool = False, initial: int = ADAPTIVE_INITIAL_WINDOW, minimum: int = 1, interval: float = ADAPTIVE_INTERVAL, label: str = ''):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.adaptive = adaptive
+        self.window = min(initial, maximum) if adaptive else maximum
+        self.interval = interval
+        self.label = label
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._waiters = AsyncWaiters()
+        self._interval_start = time.monotonic()
+        self._interval_bytes = 0
+        self._interval_errors = 0
+        self._last_throughput = 0.0
+        self._last_decrease = 0.0
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= self.window:
+                self._cond.wait(self.interval)
+                self._adjust()
+            self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight >= self.window:
+                self._adjust()
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+        self._waiters.notify()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        await self._waiters.wait_for(self.try_acquire)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record_success(self, size: int) -> None:
+        if not self.adaptive:
+            return
+        with self._cond:
+            self._interval_bytes += size
+            self._adjust()
+
+    def record_error(self, error: Optional[Exception] = None) -> None:
+        if not self.adaptive:
+            return
+        with self._cond:
+            self._interval_errors += 1
+            now = time.monotonic()
+            if now - self._last_decrease < self.interval:
+                return
+            self._last_decrease = now
+            old_window = self.window
+            self.window = max(self.minimum, self.window // 2)
+            if self.window != old_window:
+                logger.info(f"{self.label} concurrency window {old_window} -> {self.window} after error: {error}")
+
+    def _adjust(self) -> None:
+        if not self.adaptive:
+            return
+        now = time.monotonic()
+        elapsed = now - self._interval_start
+        if elapsed < self.interval:
+            return
+        throughput = self._interval_bytes / elapsed
+        old_window = self.window
+        if self._interval_errors == 0 and throughput >= self._last_throughput * (1 - ADAPTIVE_TOLERANCE) and self.window < self.maximum:
+            self.window += 1
+            self._cond.notify()
+            self._waiters.notify()
+        self._last_throughput = throughput
+        self._interval_start = now
+        self._interval_bytes = 0
+        self._interval_errors = 0
+        if self.window != old_window:
+            logger.debug(f"{self.label} concurrency window {old_window} -> {self.window} ({throughput / 1024 / 1024:.2f} MB/s)")
@@ -1,13 +1,23 @@
 RECORD_FILE = 'downloaded_urls_miyuki.txt'
+HISTORY_FILE = 'download_history_miyuki.db'
+METADATA_CACHE_FILE = 'metadata_cache_miyuki.db'
+METRICS_FILE = 'metrics_miyuki.json'
+PROFILE_DIR = 'profile_miyuki'
 FFMPEG_INPUT_FILE = 'ffmpeg_input_miyuki.txt'
 TMP_HTML_FILE = 'tmp_movie_miyuki.html'
 MOVIE_SAVE_PATH_ROOT = 'movies_folder_miyuki'
+MANIFEST_FILE = 'manifest_miyuki.json'
+MANIFEST_FLUSH_INTERVAL = 50
+PREALLOC_STATE_SUFFIX = '.state_miyuki.json'
+PREALLOC_PART_SUFFIX = '.part'
 COVER_URL_PREFIX = 'https://fourhoi.com/'
 VIDEO_M3U8_PREFIX = 'https://surrit.com/'
 VIDEO_PLAYLIST_SUFFIX = '/playlist.m3u8'
 HREF_REGEX_MOVIE_COLLECTION = r'<a class="text-secondary group-hover:text-primary" href="([^"]+)" alt="'
 HREF_REGEX_PUBLIC_PLAYLIST = r'<a href="([^"]+)" alt="'
 HREF_REGEX_NEXT_PAGE = r'<a href="([^"]+)" rel="next"'
+HREF_REGEX_PAGE_NUMBER = r'href="[^"]*[?&](?:amp;)?page=(\d+)'
+MATCH_PAGE_PARAM = r'([?&]page=)\d+'
 MATCH_UUID_PATTERN = r'm3u8\|([a-f0-9\|]+)\|com\|surrit\|https\|video'
 MATCH_TITLE_PATTERN = r'<title>([^"]+)</title>'
 RESOLUTION_PATTERN = r'RESOLUTION=(\d+)x(\d+)'
@@ -15,6 +25,38 @@ MAGIC_NUMBER = 114514
 RETRY = 5
 DELAY = 2
 TIMEOUT = 10
+RETRY_MAX_DELAY = 60
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MIN = 50
+POOL_SIZE = 16
+ASYNC_CONCURRENCY = 64
+STREAM_MEMORY_BUDGET = 64 * 1024 * 1024
+SEGMENT_BUFFER_BUDGET = 128 * 1024 * 1024
+SEGMENT_BUFFER_HINT = 2 * 1024 * 1024
+SEGMENT_BUFFER_HINT_WINDOW = 32
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+ADAPTIVE_INITIAL_WINDOW = 4
+ADAPTIVE_INTERVAL = 2.0
+ADAPTIVE_TOLERANCE = 0.05
+PROGRESS_INTERVAL = 0.5
+PROGRESS_LOG_INTERVAL = 10
+RANGE_SPLIT_MAX_PARTS = 4
+CRAWL_CONCURRENCY = 8
+PAGE_CACHE_TTL = 600
+PAGE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+METADATA_CACHE_TTL = 24 * 3600
+METADATA_CACHE_MAX_ENTRIES = 1000
+METADATA_CACHE_BUSY_TIMEOUT = 1
+METADATA_CACHE_PRUNE_INTERVAL = 100
+PROFILE_TOP_ENTRIES = 30
+PROFILE_TRACEBACK_DEPTH = 1
+TRACE_MAX_EVENTS = 500000
+HISTORY_BATCH_SIZE = 50
+HISTORY_FLUSH_INTERVAL = 2.0
+HISTORY_BUSY_TIMEOUT = 30
+HEDGE_PERCENTILE = 0.95
+HEDGE_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
 }
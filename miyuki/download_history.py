@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+from miyuki.config import HISTORY_FILE, RECORD_FILE, HISTORY_BATCH_SIZE, HISTORY_FLUSH_INTERVAL, HISTORY_BUSY_TIMEOUT
+from miyuki.logger import logger
+
+
+def normalize_movie_id(url: str) -> str:
+    movie_id = urlsplit(url.strip()).path.rstrip('/').rsplit('/', 1)[-1].lower()
+    return movie_id or url.strip()
+
+
+class DownloadHistory:
+    def __init__(self, path: str = HISTORY_FILE, legacy_file: Optional[str] = RECORD_FILE,
+                 batch_size: int = HISTORY_BATCH_SIZE, flush_interval: float = HISTORY_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._last_flush = time.monotonic()
+        self._timer = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=HISTORY_BUSY_TIMEOUT, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS downloads (movie_id TEXT PRIMARY KEY, url TEXT NOT NULL, uuid TEXT, downloaded_at REAL NOT NULL) WITHOUT ROWID')
+        if legacy_file and os.path.exists(legacy_file):
+            self._import_legacy(legacy_file)
+
+    def _import_legacy(self, legacy_file: str) -> None:
+        downloaded_at = os.path.getmtime(legacy_file)
+        with open(legacy_file, 'r', encoding='utf-8') as f:
+            rows = [(normalize_movie_id(line), line.strip(), downloaded_at) for line in f if line.strip()]
+        with self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO downloads (movie_id, url, downloaded_at) VALUES (?, ?, ?)', rows)
+        try:
+            os.replace(legacy_file, legacy_file + '.imported')
+        except OSError:
+            # Another miyuki process imported and moved it first.
+            pass
+        logger.info(f"Imported {len(rows)} entries from {legacy_file} into {self.path}")
+
+    def is_downloaded(self, url: str) -> bool:
+        movie_id = normalize_movie_id(url)
+        with self._lock:
+            if movie_id in self._pending:
+                return True
+            return self._conn.execute('SELECT 1 FROM downloads WHERE movie_id = ?', (movie_id,)).fetchone() is not None
+
+    def record_download(self, url: str, uuid: Optional[str] = None) -> None:
+        with self._lock:
+            if not self._conn:
+                logger.error(f"Download history {self.path} is already closed, {url} was not recorded.")
+                return
+            self._pending[normalize_movie_id(url)] = (url, uuid, time.time())
+            if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+            elif not self._timer:
+                # Flush a partial batch once the interval expires even if no further download finishes.
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush(self) -> None:
+        if self._pending:
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?)',
+                                       [(movie_id, url, uuid, downloaded_at) for movie_id, (url, uuid, downloaded_at) in self._pending.items()])
+            self._pending.clear()
+        self._last_flush = time.monotonic()
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn:
+                self._flush()
+                self._conn.close()
+                self._conn = None
@@ -1,3 +1,4 @@
+import os
 import subprocess
 from typing import Optional
 from miyuki.config import FFMPEG_INPUT_FILE
@@ -6,19 +7,45 @@ from miyuki.logger import logger
 
 class FFmpegProcessor:
     @staticmethod
-    def create_video_from_segments(segment_files: list[str], output_file: str, cover_file: Optional[str] = None) -> None:
-        with open(FFMPEG_INPUT_FILE, 'w') as f:
-            for file in segment_files:
-                f.write(f"file '{file}'\n")
-        ffmpeg_command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', FFMPEG_INPUT_FILE]
+    def _output_args(cover_file: Optional[str], output_file: str) -> list[str]:
         if cover_file:
-            ffmpeg_command.extend(['-i', cover_file, '-map', '0', '-map', '1', '-c', 'copy', '-disposition:v:1', 'attached_pic'])
-        else:
-            ffmpeg_command.extend(['-c', 'copy'])
-        ffmpeg_command.append(output_file)
+            return ['-i', cover_file, '-map', '0', '-map', '1', '-c', 'copy', '-disposition:v:1', 'attached_pic', output_file]
+        return ['-c', 'copy', output_file]
+
+    @staticmethod
+    def create_video_from_segments(segment_files: list[str], output_file: str, cover_file: Optional[str] = None, input_file: str = FFMPEG_INPUT_FILE) -> None:
+        with open(input_file, 'w') as f:
+            for file in segment_files:
+                f.write(f"file '{os.path.abspath(file)}'\n")
+        ffmpeg_command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', input_file]
+        ffmpeg_command.extend(FFmpegProcessor._output_args(cover_file, output_file))
         try:
             subprocess.run(ffmpeg_command, check=True, stdout=subprocess.DEVNULL)
             logger.info("FFmpeg execution completed.")
         except subprocess.CalledProcessError as e:
             logger.error(f"FFmpeg execution failed: {e}")
             raise
+
+    @staticmethod
+    def start_pipe(output_file: str, cover_file: Optional[str] = None) -> Optional[subprocess.Popen]:
+        ffmpeg_command = ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'mpegts', '-i', 'pipe:0']
+        ffmpeg_command.extend(FFmpegProcessor._output_args(cover_file, output_file))
+        try:
+            return subprocess.Popen(ffmpeg_command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+        except OSError as e:
+            logger.error(f"Failed to start FFmpeg pipe: {e}")
+            return None
+
+    @staticmethod
+    def finish_pipe(process: subprocess.Popen) -> bool:
+        if process.stdin and not process.stdin.closed:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+        returncode = process.wait()
+        if returncode != 0:
+            logger.error(f"FFmpeg pipe exited with status {returncode}.")
+            return False
+        logger.info("FFmpeg execution completed.")
+        return True
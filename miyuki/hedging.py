@@ -0,0 +1,26 @@
+import threading
+from collections import deque
+from typing import Optional
+from miyuki.config import HEDGE_PERCENTILE, HEDGE_WINDOW, HEDGE_MIN_SAMPLES
+from miyuki.utils import ThreadSafeCounter
+
+
+class LatencyTracker:
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, window: int = HEDGE_WINDOW, min_samples: int = HEDGE_MIN_SAMPLES):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.hedges_fired = ThreadSafeCounter()
+        self.hedges_won = ThreadSafeCounter()
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def threshold(self) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = sorted(self._samples)
+        return samples[int(self.percentile * (len(samples) - 1))]
@@ -1,29 +1,241 @@
-from typing import Optional
+from typing import Callable, Optional
+from contextlib import contextmanager
+import asyncio
+import queue
+import threading
 import time
-from curl_cffi import requests
-from miyuki.config import HEADERS, RETRY, DELAY, TIMEOUT
+from curl_cffi import requests, CurlInfo, CurlHttpVersion
+from miyuki.config import HEADERS, RETRY, DELAY, TIMEOUT, POOL_SIZE
 from miyuki.logger import logger
+from miyuki.utils import ThreadSafeCounter
+from miyuki.buffer_pool import BufferPool, PooledBuffer, BufferBudgetExceeded
+from miyuki.retry_policy import RetryPolicy
+from miyuki.request_tracer import request_tracer, Span
+
+CURL_INFOS = [CurlInfo.NUM_CONNECTS, CurlInfo.APPCONNECT_TIME, CurlInfo.CONNECT_TIME, CurlInfo.STARTTRANSFER_TIME, CurlInfo.TOTAL_TIME]
+
+
+def trace_response(span: Span, response: requests.Response) -> None:
+    infos = response.infos
+    span.set(status=response.status_code, connections=infos.get(CurlInfo.NUM_CONNECTS, 0))
+    connect = infos.get(CurlInfo.APPCONNECT_TIME) or infos.get(CurlInfo.CONNECT_TIME, 0.0)
+    span.timings(connect, infos.get(CurlInfo.STARTTRANSFER_TIME, 0.0), infos.get(CurlInfo.TOTAL_TIME, 0.0))
 
 
 class HttpClient:
-    def get(self, url: str, cookies: Optional[dict] = None, retries: int = RETRY, delay: int = DELAY, timeout: int = TIMEOUT) -> Optional[bytes]:
-        for attempt in range(retries):
+    def __init__(self, pool_size: int = POOL_SIZE):
+        self.pool_size = pool_size
+        self._idle_sessions = queue.LifoQueue()
+        self._created_sessions = 0
+        self._pool_lock = threading.Lock()
+        self.connections_opened = ThreadSafeCounter()
+        self.requests_served = ThreadSafeCounter()
+
+    def _new_session(self) -> requests.Session:
+        return requests.Session(
+            use_thread_local_curl=False,
+            headers=HEADERS,
+            verify=False,
+            http_version=CurlHttpVersion.V2TLS,
+            curl_infos=CURL_INFOS,
+        )
+
+    @contextmanager
+    def _session(self):
+        try:
+            session = self._idle_sessions.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_create = self._created_sessions < self.pool_size
+                if can_create:
+                    self._created_sessions += 1
+            session = self._new_session() if can_create else self._idle_sessions.get()
+        try:
+            yield session
+        finally:
+            self._idle_sessions.put(session)
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        with request_tracer.span(method, 'http', url=url) as span, self._session() as session:
+            response = session.request(method, url, **kwargs)
+            trace_response(span, response)
+        self.connections_opened.add_and_get(response.infos.get(CurlInfo.NUM_CONNECTS, 0))
+        self.requests_served.increment_and_get()
+        return response
+
+    def _request_into(self, url: str, buffer: PooledBuffer, request_counter: Optional[ThreadSafeCounter] = None, **kwargs) -> requests.Response:
+        while True:
             try:
-                response = requests.get(url=url, headers=HEADERS, cookies=cookies, timeout=timeout, verify=False)
+                return self._request('GET', url, content_callback=buffer.write, **kwargs)
+            except BufferBudgetExceeded as e:
+                buffer.pool.resize(buffer, e.size)
+                if request_counter:
+                    request_counter.increment_and_get()
+
+    def stats(self) -> dict:
+        return {
+            'sessions': self._created_sessions,
+            'connections_opened': self.connections_opened.get(),
+            'requests_served': self.requests_served.get(),
+        }
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle_sessions.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def get(self, url: str, cookies: Optional[dict] = None, headers: Optional[dict] = None, retries: int = RETRY, delay: int = DELAY, timeout: int = TIMEOUT, on_error: Optional[Callable[[Exception], None]] = None, policy: Optional[RetryPolicy] = None, request_counter: Optional[ThreadSafeCounter] = None) -> Optional[bytes]:
+        policy = policy or RetryPolicy(retries, delay)
+        for attempt in range(policy.retries):
+            if request_counter:
+                request_counter.increment_and_get()
+            try:
+                response = self._request('GET', url, cookies=cookies, headers=headers, timeout=timeout)
+                policy.check_response(response)
                 return response.content
             except Exception as e:
-                logger.error(f"Failed to fetch data (attempt {attempt + 1}/{retries}): {e} url is: {url}")
-                time.sleep(delay)
-        logger.error(f"Max retries reached. Failed to fetch data. url is: {url}")
+                logger.error(f"Failed to fetch data (attempt {attempt + 1}/{policy.retries}): {e} url is: {url}")
+                if on_error:
+                    on_error(e)
+                if not policy.should_retry(e, attempt):
+                    break
+                time.sleep(policy.backoff(e, attempt))
+        logger.error(f"Giving up on fetching data. url is: {url}")
+        return None
+
+    def get_into(self, url: str, buffers: BufferPool, headers: Optional[dict] = None, timeout: int = TIMEOUT, on_error: Optional[Callable[[Exception], None]] = None, policy: Optional[RetryPolicy] = None, cancelled: Optional[threading.Event] = None, request_counter: Optional[ThreadSafeCounter] = None) -> Optional[PooledBuffer]:
+        policy = policy or RetryPolicy()
+        buffer = buffers.acquire()
+        for attempt in range(policy.retries):
+            if cancelled and cancelled.is_set():
+                buffer.release()
+                return None
+            if request_counter:
+                request_counter.increment_and_get()
+            buffer.clear()
+            try:
+                response = self._request_into(url, buffer, request_counter, headers=headers, timeout=timeout)
+                policy.check_status(response)
+                policy.check_length(response, len(buffer))
+                buffers.record_size(len(buffer))
+                return buffer
+            except Exception as e:
+                logger.error(f"Failed to fetch data (attempt {attempt + 1}/{policy.retries}): {e} url is: {url}")
+                if on_error:
+                    on_error(e)
+                if (cancelled and cancelled.is_set()) or not policy.should_retry(e, attempt):
+                    break
+                if cancelled:
+                    cancelled.wait(policy.backoff(e, attempt))
+                else:
+                    time.sleep(policy.backoff(e, attempt))
+        buffer.release()
+        logger.error(f"Giving up on fetching data. url is: {url}")
+        return None
+
+    def content_length(self, url: str, headers: Optional[dict] = None, timeout: int = TIMEOUT, policy: Optional[RetryPolicy] = None, request_counter: Optional[ThreadSafeCounter] = None) -> Optional[int]:
+        policy = policy or RetryPolicy(1)
+        for attempt in range(policy.retries):
+            if request_counter:
+                request_counter.increment_and_get()
+            try:
+                response = self._request('HEAD', url, headers=headers, timeout=timeout)
+                policy.check_status(response)
+                content_length = response.headers.get('Content-Length')
+                return int(content_length) if content_length and content_length.isdigit() else None
+            except Exception as e:
+                logger.error(f"Failed to probe content length (attempt {attempt + 1}/{policy.retries}): {e} url is: {url}")
+                if not policy.should_retry(e, attempt):
+                    break
+                time.sleep(policy.backoff(e, attempt))
         return None
 
     def post(self, url: str, data: dict, cookies: Optional[dict] = None, retries: int = RETRY, delay: int = DELAY, timeout: int = TIMEOUT) -> Optional[requests.Response]:
+        policy = RetryPolicy(retries, delay)
         for attempt in range(retries):
             try:
-                response = requests.post(url=url, data=data, headers=HEADERS, cookies=cookies, timeout=timeout, verify=False)
+                response = self._request('POST', url, data=data, cookies=cookies, timeout=timeout)
                 return response
             except Exception as e:
                 logger.error(f"Failed to post data (attempt {attempt + 1}/{retries}): {e} url is: {url}")
-                time.sleep(delay)
+                if not policy.should_retry(e, attempt):
+                    break
+                time.sleep(policy.backoff(e, attempt))
         logger.error(f"Max retries reached. Failed to post data. url is: {url}")
         return None
+
+
+class AsyncHttpClient:
+    def __init__(self, max_clients: int = POOL_SIZE):
+        self.max_clients = max_clients
+        self.session = None
+        self.connections_opened = ThreadSafeCounter()
+        self.requests_served = ThreadSafeCounter()
+
+    async def __aenter__(self) -> 'AsyncHttpClient':
+        self.session = requests.AsyncSession(
+            max_clients=self.max_clients,
+            headers=HEADERS,
+            verify=False,
+            http_version=CurlHttpVersion.V2TLS,
+            curl_infos=CURL_INFOS,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.session.close()
+        self.session = None
+
+    def stats(self) -> dict:
+        return {
+            'sessions': 1,
+            'connections_opened': self.connections_opened.get(),
+            'requests_served': self.requests_served.get(),
+        }
+
+    async def _get(self, url: str, **kwargs) -> requests.Response:
+        with request_tracer.span('GET', 'http', url=url) as span:
+            response = await self.session.get(url, **kwargs)
+            trace_response(span, response)
+        self.connections_opened.add_and_get(response.infos.get(CurlInfo.NUM_CONNECTS, 0))
+        self.requests_served.increment_and_get()
+        return response
+
+    async def _get_into_buffer(self, url: str, buffer: PooledBuffer, request_counter: Optional[ThreadSafeCounter] = None, **kwargs) -> requests.Response:
+        while True:
+            try:
+                return await self._get(url, content_callback=buffer.write, **kwargs)
+            except BufferBudgetExceeded as e:
+                await buffer.pool.async_resize(buffer, e.size)
+                if request_counter:
+                    request_counter.increment_and_get()
+
+    async def get_into(self, url: str, buffers: BufferPool, headers: Optional[dict] = None, timeout: int = TIMEOUT, on_error: Optional[Callable[[Exception], None]] = None, policy: Optional[RetryPolicy] = None, request_counter: Optional[ThreadSafeCounter] = None) -> Optional[PooledBuffer]:
+        policy = policy or RetryPolicy()
+        buffer = await buffers.async_acquire()
+        try:
+            for attempt in range(policy.retries):
+                if request_counter:
+                    request_counter.increment_and_get()
+                buffer.clear()
+                try:
+                    response = await self._get_into_buffer(url, buffer, request_counter, headers=headers, timeout=timeout)
+                    policy.check_status(response)
+                    policy.check_length(response, len(buffer))
+                    buffers.record_size(len(buffer))
+                    return buffer
+                except Exception as e:
+                    logger.error(f"Failed to fetch data (attempt {attempt + 1}/{policy.retries}): {e} url is: {url}")
+                    if on_error:
+                        on_error(e)
+                    if not policy.should_retry(e, attempt):
+                        break
+                    await asyncio.sleep(policy.backoff(e, attempt))
+        except BaseException:
+            buffer.release()
+            raise
+        buffer.release()
+        logger.error(f"Giving up on fetching data. url is: {url}")
+        return None
@@ -3,7 +3,7 @@ import logging
 logger = logging.getLogger('miyuki-logger')
 logger.setLevel(logging.DEBUG)
 
-file_handler = logging.FileHandler('miyuki.log')
+file_handler = logging.FileHandler('miyuki.log', delay=True)
 file_handler.setLevel(logging.DEBUG)
 
 console_handler = logging.StreamHandler()
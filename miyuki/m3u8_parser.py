@@ -0,0 +1,76 @@
+from typing import Iterator, Optional, Tuple
+from urllib.parse import urljoin
+
+
+class Segment:
+    __slots__ = ('index', 'sequence', 'uri', 'duration', 'byte_range')
+
+    def __init__(self, index: int, sequence: int, uri: str, duration: float, byte_range: Optional[Tuple[int, int]] = None):
+        self.index = index
+        self.sequence = sequence
+        self.uri = uri
+        self.duration = duration
+        self.byte_range = byte_range
+
+    def range_header(self) -> Optional[dict]:
+        if not self.byte_range:
+            return None
+        length, offset = self.byte_range
+        return {'Range': f"bytes={offset}-{offset + length - 1}"}
+
+
+class MediaPlaylist:
+    def __init__(self, segments: list[Segment], target_duration: Optional[float] = None, ended: bool = False):
+        self.segments = segments
+        self.target_duration = target_duration
+        self.ended = ended
+
+    def __len__(self) -> int:
+        return len(self.segments)
+
+    def __iter__(self) -> Iterator[Segment]:
+        return iter(self.segments)
+
+    def __getitem__(self, index: int) -> Segment:
+        return self.segments[index]
+
+    @property
+    def duration(self) -> float:
+        return sum(segment.duration for segment in self.segments)
+
+
+def parse_media_playlist(text: str, base_url: str) -> MediaPlaylist:
+    segments = []
+    sequence = 0
+    target_duration = None
+    ended = False
+    duration = 0.0
+    byte_range = None
+    next_offsets = {}
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            sequence = int(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-TARGETDURATION:'):
+            target_duration = float(line.split(':', 1)[1])
+        elif line.startswith('#EXTINF:'):
+            duration = float(line.split(':', 1)[1].split(',', 1)[0] or 0)
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            length, _, offset = line.split(':', 1)[1].partition('@')
+            byte_range = (int(length), int(offset) if offset else None)
+        elif line.startswith('#EXT-X-ENDLIST'):
+            ended = True
+        elif not line.startswith('#'):
+            uri = urljoin(base_url, line)
+            if byte_range:
+                length, offset = byte_range
+                if offset is None:
+                    offset = next_offsets.get(uri, 0)
+                byte_range = (length, offset)
+                next_offsets[uri] = offset + length
+            segments.append(Segment(len(segments), sequence + len(segments), uri, duration, byte_range))
+            duration = 0.0
+            byte_range = None
+    return MediaPlaylist(segments, target_duration, ended)
@@ -1,12 +1,24 @@
 import argparse
 import os
 import subprocess
+import sys
+import tracemalloc
+from contextlib import nullcontext
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from miyuki.logger import logger
-from miyuki.config import MOVIE_SAVE_PATH_ROOT, RECORD_FILE, MAGIC_NUMBER
+from miyuki.config import MOVIE_SAVE_PATH_ROOT, METRICS_FILE, MAGIC_NUMBER, POOL_SIZE, ASYNC_CONCURRENCY, PROFILE_TRACEBACK_DEPTH
 from miyuki.http_client import HttpClient
 from miyuki.url_sources import SingleUrlSource, PlaylistSource, AuthSource, SearchSource, FileSource, AutoUrlSource
 from miyuki.video_downloader import VideoDownloader
-from miyuki.utils import delete_all_subfolders, ThreadSafeCounter
+from miyuki.utils import delete_all_subfolders, ThreadSafeCounter, ConnectionBudget, peak_rss
+from miyuki.buffer_pool import BufferPool
+from miyuki.page_cache import page_cache
+from miyuki.request_tracer import request_tracer
+from miyuki.metadata_cache import MetadataCache, open_metadata_cache
+from miyuki.run_metrics import MovieMetrics, RunMetrics
+from miyuki.profiler import MovieProfiler
+from miyuki.download_history import DownloadHistory
 
 banner = """
  ██████   ██████  ███                        █████       ███ 
@@ -23,21 +35,36 @@ banner = """
 """
 
 
-class DownloadTracker:
-    def __init__(self, record_file: str):
-        self.record_file = record_file
-        self.downloaded_urls = set()
-        if os.path.exists(record_file):
-            with open(record_file, 'r', encoding='utf-8') as f:
-                self.downloaded_urls.update(line.strip() for line in f)
-
-    def is_downloaded(self, url: str) -> bool:
-        return url in self.downloaded_urls
-
-    def record_download(self, url: str) -> None:
-        self.downloaded_urls.add(url)
-        with open(self.record_file, 'a', encoding='utf-8') as f:
-            f.write(url + '\n')
+def download_movie(url: str, http_client: HttpClient, options: dict, download_history: DownloadHistory, budget: ConnectionBudget, buffers: BufferPool, metadata_cache: Optional[MetadataCache], run_metrics: RunMetrics) -> None:
+    if download_history.is_downloaded(url):
+        logger.info(f"{url} already downloaded, skipping.")
+        metrics = MovieMetrics(url)
+        metrics.status = 'skipped'
+        run_metrics.add(metrics)
+        return
+    downloader = VideoDownloader(url, http_client, options, budget, buffers, metadata_cache)
+    run_metrics.add(downloader.metrics)
+    if options.get('profile'):
+        downloader.profiler = MovieProfiler(downloader.movie_name)
+    if not options.get('resume'):
+        downloader.clean()
+    try:
+        logger.info(f"Processing URL: {url}")
+        with downloader.profiler.profile() if downloader.profiler else nullcontext():
+            downloader.download()
+        metrics = downloader.metrics
+        metrics.status = 'failed' if not metrics.segments_total else 'completed' if metrics.segments_complete == metrics.segments_total else 'incomplete'
+        if metrics.status == 'completed':
+            download_history.record_download(url, downloader.uuid)
+        logger.info(f"Processing URL Complete: {url}")
+    except Exception as e:
+        downloader.metrics.status = 'failed'
+        downloader.metrics.error = str(e)
+        logger.error(f"Failed to download {url}: {e}")
+    if downloader.profiler:
+        downloader.profiler.dump()
+    if not options.get('resume'):
+        downloader.clean()
 
 
 def check_ffmpeg_command(ffmpeg: bool) -> bool:
@@ -58,10 +85,10 @@ def validate_args(args):
     if args.auth and len(args.auth) != 2:
         logger.error("Auth requires username and password.")
         exit(MAGIC_NUMBER)
-    if not check_ffmpeg_command(args.ffmpeg) or not check_ffmpeg_command(args.ffcover):
+    if not check_ffmpeg_command(args.ffmpeg) or not check_ffmpeg_command(args.ffcover) or not check_ffmpeg_command(args.ffpipe):
         logger.error("FFmpeg command status error.")
         exit(MAGIC_NUMBER)
-    for opt in ['limit', 'quality', 'retry', 'delay', 'timeout']:
+    for opt in ['limit', 'quality', 'retry', 'delay', 'timeout', 'pool', 'workers', 'parallel', 'split']:
         value = getattr(args, opt)
         if value and (not value.isdigit() or int(value) <= 0):
             logger.error(f"The -{opt} option must be a positive integer.")
@@ -94,7 +121,24 @@ def main():
                     'Use the -quality option to specify the movie resolution (360, 480, 720, 1080...)\n'
                     'Use the -retry   option to specify the number of retries for downloading segments\n'
                     'Use the -delay   option to specify the delay before retry ( seconds )\n'
-                    'Use the -timeout option to specify the timeout for segment download ( seconds )\n',
+                    'Use the -timeout option to specify the timeout for segment download ( seconds )\n'
+                    'Use the -pool    option to specify the number of reusable HTTP sessions ( keep-alive connections )\n'
+                    'Use the -workers option to specify the number of concurrent segment downloads ( default: CPU count )\n'
+                    'Use the -engine  option to choose the segment download engine: thread or async ( default: thread )\n'
+                    'Use the -resume  option to keep partially downloaded movies and only fetch missing segments next time\n'
+                    'Use the -stream  option to write segments into the movie file as they arrive ( without ffmpeg or -resume )\n'
+                    'Use the -ffpipe  option to pipe segments into ffmpeg while downloading ( implies -ffmpeg, not with -resume )\n'
+                    'Use the -parallel option to download several movies at once, sharing the -pool connection budget ( progress is logged per movie instead of a live bar )\n'
+                    'Use the -adaptive option to tune concurrency from throughput and errors ( -workers becomes the upper limit )\n'
+                    'Use the -noprog  option to turn off the progress display ( headless runs )\n'
+                    'Use the -split   option to fetch tail segments larger than this size ( KB ) as parallel range requests\n'
+                    'Use the -hedge   option to duplicate slow tail segment requests and keep whichever finishes first\n'
+                    'Use the -prealloc option to preallocate the movie file and write segments in place ( without ffmpeg, resumable; sends one HEAD request per segment first unless the playlist has byte ranges )\n'
+                    'Use the -nocache option to ignore the on-disk cache of movie metadata and playlists\n'
+                    'Use the -metrics option to choose where the JSON run summary is written ( default: metrics_miyuki.json )\n'
+                    'Use the -prom    option to also write the run metrics as a Prometheus textfile\n'
+                    'Use the -profile option to write cProfile stats and allocation snapshots per movie to profile_miyuki\n'
+                    'Use the -trace   option to write a Chrome trace ( Perfetto ) timeline of segment requests and page fetches\n',
         epilog='Examples:\n'
                '  miyuki -auto "https://missav.ai/sw-950" "https://missav.ai/dm132/actresses/JULIA"\n'
                '  miyuki -plist "https://missav.ai/dm132/actresses/JULIA" -limit 20 -ffcover\n'
@@ -122,6 +166,23 @@ def main():
     parser.add_argument('-retry', type=str, metavar='', help='Number of retries for downloading segments')
     parser.add_argument('-delay', type=str, metavar='', help='Delay in seconds before retry')
     parser.add_argument('-timeout', type=str, metavar='', help='Timeout in seconds for segment download')
+    parser.add_argument('-pool', type=str, metavar='', help='Number of pooled HTTP sessions')
+    parser.add_argument('-workers', type=str, metavar='', help='Number of concurrent segment downloads')
+    parser.add_argument('-resume', action='store_true', help='Resume partially downloaded movies')
+    parser.add_argument('-stream', action='store_true', help='Assemble the movie while segments are downloading')
+    parser.add_argument('-ffpipe', action='store_true', help='Pipe segments into ffmpeg while downloading')
+    parser.add_argument('-parallel', type=str, metavar='', help='Number of movies downloaded at once')
+    parser.add_argument('-adaptive', action='store_true', help='Adapt segment concurrency to throughput and errors')
+    parser.add_argument('-noprog', action='store_true', help='Do not display download progress')
+    parser.add_argument('-split', type=str, metavar='', help='Range-split tail segments above this size in KB')
+    parser.add_argument('-hedge', action='store_true', help='Hedge slow tail segment requests')
+    parser.add_argument('-prealloc', action='store_true', help='Write segments in place into a preallocated movie file (one HEAD request per segment to learn its size)')
+    parser.add_argument('-nocache', action='store_true', help='Do not use the metadata cache')
+    parser.add_argument('-metrics', type=str, metavar='', default=METRICS_FILE, help='JSON run summary file')
+    parser.add_argument('-prom', type=str, metavar='', help='Prometheus textfile for the run metrics')
+    parser.add_argument('-profile', action='store_true', help='Profile each movie with cProfile and tracemalloc')
+    parser.add_argument('-trace', type=str, metavar='', help='Chrome trace JSON file for request timelines')
+    parser.add_argument('-engine', type=str, metavar='', choices=['thread', 'async'], default='thread', help='Segment download engine (thread, async)')
 
     args = parser.parse_args()
     logger.info(str(args))
@@ -134,12 +195,19 @@ def main():
         args.ffmpeg = True
         args.cover = True
 
+    if args.ffpipe:
+        args.ffmpeg = True
+
     if args.proxy:
         logger.info("Network proxy enabled.")
         os.environ["http_proxy"] = f"http://{args.proxy}"
         os.environ["https_proxy"] = f"http://{args.proxy}"
 
-    http_client = HttpClient()
+    if args.trace:
+        request_tracer.enable()
+
+    num_workers = int(args.workers) if args.workers else ASYNC_CONCURRENCY if args.engine == 'async' else os.cpu_count()
+    http_client = HttpClient(pool_size=int(args.pool) if args.pool else max(POOL_SIZE, num_workers))
     movie_counter = ThreadSafeCounter()
     source = (
         AutoUrlSource(movie_counter, args.auto, args.limit) if args.auto else
@@ -153,17 +221,23 @@ def main():
         logger.error("No source specified.")
         exit(MAGIC_NUMBER)
 
-    movie_urls = source.get_urls()
-    if not movie_urls:
-        logger.error("No URLs to download.")
-        exit(MAGIC_NUMBER)
-
-    download_tracker = DownloadTracker(RECORD_FILE)
+    download_history = DownloadHistory()
     options = {
         'download_action': True,
         'write_action': True,
         'ffmpeg_action': args.ffmpeg,
-        'num_threads': os.cpu_count(),
+        'num_workers': num_workers,
+        'engine': args.engine,
+        'resume': args.resume,
+        'stream': args.stream,
+        'ffmpeg_pipe': args.ffpipe,
+        'parallel': int(args.parallel) if args.parallel else 1,
+        'adaptive': args.adaptive,
+        'progress': not args.noprog,
+        'split_threshold': int(args.split) * 1024 if args.split else None,
+        'hedge': args.hedge,
+        'preallocate': args.prealloc,
+        'profile': args.profile,
         'cover_action': args.cover,
         'title_action': args.title,
         'cover_as_preview': args.ffcover,
@@ -173,21 +247,57 @@ def main():
         'timeout': int(args.timeout) if args.timeout else 10
     }
 
-    for url in movie_urls:
-        if download_tracker.is_downloaded(url):
-            logger.info(f"{url} already downloaded, skipping.")
-            continue
+    if not args.resume:
         delete_all_subfolders(MOVIE_SAVE_PATH_ROOT)
+    if args.profile:
+        tracemalloc.start(PROFILE_TRACEBACK_DEPTH)
+        if options['parallel'] > 1 and sys.version_info >= (3, 12):
+            logger.warning("Python 3.12+ allows only one active profiler, so -profile downloads one movie at a time.")
+            options['parallel'] = 1
+    budget = ConnectionBudget(http_client.pool_size)
+    buffers = BufferPool()
+    metadata_cache = open_metadata_cache() if not args.nocache else None
+    run_metrics = RunMetrics()
+    try:
+        submitted = 0
+        executor = ThreadPoolExecutor(max_workers=options['parallel'])
         try:
-            logger.info(f"Processing URL: {url}")
-            downloader = VideoDownloader(url, http_client, options)
-            downloader.download()
-            download_tracker.record_download(url)
-            logger.info(f"Processing URL Complete: {url}")
-            print()
-        except Exception as e:
-            logger.error(f"Failed to download {url}: {e}")
-        delete_all_subfolders(MOVIE_SAVE_PATH_ROOT)
+            for url in source.iter_urls():
+                executor.submit(download_movie, url, http_client, options, download_history, budget, buffers, metadata_cache, run_metrics)
+                submitted += 1
+            executor.shutdown(wait=True)
+        except KeyboardInterrupt:
+            # Queued movies are dropped, but running ones still record their history before it is closed below.
+            logger.warning("Interrupted, waiting for the movies already downloading to finish.")
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            executor.shutdown(wait=True)
+        if not submitted:
+            logger.error("No URLs to download.")
+            if args.trace:
+                request_tracer.write(args.trace)
+            exit(MAGIC_NUMBER)
+
+        stats = http_client.stats()
+        logger.info(f"HTTP connections opened: {stats['connections_opened']}, requests served: {stats['requests_served']}, sessions: {stats['sessions']}")
+        rss = peak_rss()
+        run_metrics.finish(stats, {'buffer_high_water_bytes': buffers.high_water, 'buffer_budget_bytes': buffers.max_bytes, 'peak_rss_bytes': rss})
+        run_metrics.write_json(args.metrics)
+        if args.prom:
+            run_metrics.write_prometheus(args.prom)
+        logger.info(f"Run summary written to {args.metrics}")
+        if args.trace:
+            request_tracer.write(args.trace)
+            logger.info(f"Request trace written to {args.trace}" + (f" ({request_tracer.dropped} events dropped)" if request_tracer.dropped else ""))
+        logger.info(f"Page cache hits: {page_cache.hits}, misses: {page_cache.misses}")
+        logger.info(f"Segment buffer high-water mark: {buffers.high_water / 1024 / 1024:.1f} MB of {buffers.max_bytes / 1024 / 1024:.0f} MB"
+                    + (f", peak RSS: {rss / 1024 / 1024:.1f} MB" if rss else ""))
+    finally:
+        http_client.close()
+        download_history.close()
+        if metadata_cache:
+            metadata_cache.close()
 
 
 if __name__ == "__main__":
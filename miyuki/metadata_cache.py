@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+import time
+from functools import wraps
+from typing import Optional
+from miyuki.config import METADATA_CACHE_FILE, METADATA_CACHE_TTL, METADATA_CACHE_MAX_ENTRIES, METADATA_CACHE_BUSY_TIMEOUT, METADATA_CACHE_PRUNE_INTERVAL
+from miyuki.logger import logger
+
+
+def _miss_on_error(method):
+    # The cache only saves requests, so a locked or broken database must never fail a download.
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except sqlite3.Error as e:
+            logger.error(f"Metadata cache {self.path} {method.__name__} failed, continuing without it: {e}")
+            return None
+    return wrapper
+
+
+class MetadataCache:
+    def __init__(self, path: str = METADATA_CACHE_FILE, ttl: float = METADATA_CACHE_TTL, max_entries: int = METADATA_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(path, timeout=METADATA_CACHE_BUSY_TIMEOUT, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS movies (url TEXT PRIMARY KEY, uuid TEXT NOT NULL, title TEXT, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS playlists (url TEXT NOT NULL, key TEXT NOT NULL, body TEXT NOT NULL, PRIMARY KEY (url, key))')
+        self._prune()
+
+    @_miss_on_error
+    def get_movie(self, url: str) -> Optional[tuple[str, Optional[str]]]:
+        with self._lock:
+            row = self._conn.execute('SELECT uuid, title, stored_at FROM movies WHERE url = ?', (url,)).fetchone()
+            if row is None or time.time() - row[2] > self.ttl:
+                return None
+            try:
+                with self._conn:
+                    self._conn.execute('UPDATE movies SET accessed_at = ? WHERE url = ?', (time.time(), url))
+            except sqlite3.Error as e:
+                logger.debug(f"Could not refresh {url} in metadata cache {self.path}: {e}")
+            return row[0], row[1]
+
+    @_miss_on_error
+    def put_movie(self, url: str, uuid: str, title: Optional[str]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM playlists WHERE url = ?', (url,))
+            self._conn.execute('INSERT OR REPLACE INTO movies VALUES (?, ?, ?, ?, ?)', (url, uuid, title, now, now))
+            self._puts += 1
+        if self._puts % METADATA_CACHE_PRUNE_INTERVAL == 0:
+            self._prune()
+
+    @_miss_on_error
+    def get_playlist(self, url: str, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute('SELECT body FROM playlists WHERE url = ? AND key = ?', (url, key)).fetchone()
+            return row[0] if row else None
+
+    @_miss_on_error
+    def put_playlist(self, url: str, key: str, body: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO playlists VALUES (?, ?, ?)', (url, key, body))
+
+    @_miss_on_error
+    def invalidate(self, url: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM movies WHERE url = ?', (url,))
+            self._conn.execute('DELETE FROM playlists WHERE url = ?', (url,))
+
+    @_miss_on_error
+    def _prune(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM movies WHERE stored_at < ?', (time.time() - self.ttl,))
+            self._conn.execute('DELETE FROM movies WHERE url NOT IN (SELECT url FROM movies ORDER BY accessed_at DESC LIMIT ?)', (self.max_entries,))
+            self._conn.execute('DELETE FROM playlists WHERE url NOT IN (SELECT url FROM movies)')
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_metadata_cache(path: str = METADATA_CACHE_FILE) -> Optional[MetadataCache]:
+    try:
+        return MetadataCache(path)
+    except sqlite3.Error as e:
+        logger.error(f"Metadata cache {path} unavailable, continuing without it: {e}")
+        return None
@@ -0,0 +1,57 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+from miyuki.config import PAGE_CACHE_TTL, PAGE_CACHE_MAX_BYTES
+
+
+class PageCache:
+    def __init__(self, ttl: float = PAGE_CACHE_TTL, max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, content = entry
+            if time.monotonic() - stored_at > self.ttl:
+                self._discard(url)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+            return content
+
+    def put(self, url: str, content: bytes) -> None:
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(url)
+            self._entries[url] = (time.monotonic(), content)
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def fetch(self, url: str, loader: Callable[[str], Optional[bytes]]) -> Optional[bytes]:
+        content = self.get(url)
+        if content is None:
+            content = loader(url)
+            if content:
+                self.put(url, content)
+        return content
+
+    def _discard(self, url: str) -> None:
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+page_cache = PageCache()
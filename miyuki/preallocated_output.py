@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import zlib
+from itertools import accumulate
+from typing import Optional
+from miyuki.config import MANIFEST_FLUSH_INTERVAL, PREALLOC_PART_SUFFIX
+from miyuki.logger import logger
+
+
+class PreallocatedOutput:
+    def __init__(self, output_file: str, state_file: str, uuid: str, resolution: str, sizes: list[int]):
+        self.output_file = output_file
+        self.part_file = output_file + PREALLOC_PART_SUFFIX
+        self.state_file = state_file
+        self.uuid = uuid
+        self.resolution = resolution
+        self.sizes = sizes
+        self.offsets = [0] + list(accumulate(sizes))[:-1]
+        self.total_size = sum(sizes)
+        self.crcs = {}
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._fd = None
+
+    @staticmethod
+    def load_sizes(state_file: str, uuid: str, resolution: str) -> Optional[list[int]]:
+        state = PreallocatedOutput._read_state(state_file)
+        if state and state.get('uuid') == uuid and state.get('resolution') == resolution:
+            return state.get('sizes')
+        return None
+
+    @staticmethod
+    def _read_state(state_file: str) -> Optional[dict]:
+        if not os.path.exists(state_file):
+            return None
+        try:
+            with open(state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable state file {state_file}: {e}")
+            return None
+
+    def open(self) -> None:
+        state = self._read_state(self.state_file)
+        resumable = (state and state.get('uuid') == self.uuid and state.get('resolution') == self.resolution
+                     and state.get('sizes') == self.sizes and os.path.exists(self.part_file)
+                     and os.path.getsize(self.part_file) == self.total_size)
+        self._fd = os.open(self.part_file, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        if resumable:
+            for index, crc in state.get('segments', {}).items():
+                if self._verify(int(index), crc):
+                    self.crcs[int(index)] = crc
+            if len(self.crcs) < len(state.get('segments', {})):
+                logger.info(f"{len(state['segments']) - len(self.crcs)} segments in {self.part_file} failed verification and will be downloaded again.")
+            return
+        os.ftruncate(self._fd, 0)
+        try:
+            os.posix_fallocate(self._fd, 0, self.total_size)
+        except (AttributeError, OSError):
+            os.ftruncate(self._fd, self.total_size)
+        self._save()
+
+    def _verify(self, index: int, crc: int) -> bool:
+        try:
+            return zlib.crc32(os.pread(self._fd, self.sizes[index], self.offsets[index])) == crc
+        except (IndexError, OSError):
+            return False
+
+    @property
+    def completed(self) -> int:
+        return len(self.crcs)
+
+    def is_complete(self, index: int) -> bool:
+        return index in self.crcs
+
+    def write(self, index: int, content: bytes) -> bool:
+        if len(content) != self.sizes[index]:
+            logger.error(f"Segment {index} is {len(content)} bytes, expected {self.sizes[index]}.")
+            return False
+        view = memoryview(content)
+        offset = self.offsets[index]
+        while view:
+            written = os.pwrite(self._fd, view, offset)
+            view = view[written:]
+            offset += written
+        with self._lock:
+            self.crcs[index] = zlib.crc32(content)
+            self._unsaved += 1
+            if self._unsaved >= MANIFEST_FLUSH_INTERVAL:
+                self._save()
+        return True
+
+    def _save(self) -> None:
+        # The recorded segments must be on disk before the state claims them.
+        getattr(os, 'fdatasync', os.fsync)(self._fd)
+        state = {
+            'uuid': self.uuid,
+            'resolution': self.resolution,
+            'sizes': self.sizes,
+            'segments': {str(index): crc for index, crc in self.crcs.items()},
+        }
+        tmp_path = self.state_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_file)
+        self._unsaved = 0
+
+    def close(self) -> bool:
+        with self._lock:
+            complete = self.completed == len(self.sizes)
+            if complete:
+                os.fsync(self._fd)
+            else:
+                self._save()
+            os.close(self._fd)
+            self._fd = None
+            if complete:
+                os.replace(self.part_file, self.output_file)
+                if os.path.exists(self.state_file):
+                    os.remove(self.state_file)
+            return complete
@@ -0,0 +1,81 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from miyuki.config import PROFILE_DIR, PROFILE_TOP_ENTRIES
+from miyuki.logger import logger
+
+
+class MovieProfiler:
+    def __init__(self, movie_name: str, output_dir: str = PROFILE_DIR, top: int = PROFILE_TOP_ENTRIES):
+        self.movie_name = movie_name
+        self.output_dir = output_dir
+        self.top = top
+        self.profiles = []
+        self.snapshots = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profile(self):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Only one profiler may be active at a time on Python 3.12+.
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self.profiles.append(profile)
+
+    def snapshot(self, label: str) -> None:
+        if tracemalloc.is_tracing():
+            self.snapshots.append((label, tracemalloc.take_snapshot()))
+
+    def _write_stats(self, base_path: str) -> bool:
+        with self._lock:
+            profiles = list(self.profiles)
+        if not profiles:
+            return False
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats(f"{base_path}.pstats")
+        report = io.StringIO()
+        pstats.Stats(*profiles, stream=report).sort_stats('cumulative').print_stats(self.top)
+        with open(f"{base_path}.profile.txt", 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+        return True
+
+    def _write_allocations(self, base_path: str) -> bool:
+        if not self.snapshots:
+            return False
+        with open(f"{base_path}.allocations.txt", 'w', encoding='utf-8') as f:
+            previous = None
+            for label, snapshot in self.snapshots:
+                if previous is None:
+                    f.write(f"== {label}: top {self.top} allocation sites ==\n")
+                    entries = snapshot.statistics('lineno')[:self.top]
+                else:
+                    f.write(f"== {label}: top {self.top} allocation changes since {previous[0]} ==\n")
+                    entries = snapshot.compare_to(previous[1], 'lineno')[:self.top]
+                for entry in entries:
+                    f.write(f"{entry}\n")
+                f.write('\n')
+                previous = (label, snapshot)
+        return True
+
+    def dump(self) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        base_path = os.path.join(self.output_dir, self.movie_name)
+        profiled = self._write_stats(base_path)
+        traced = self._write_allocations(base_path)
+        self.snapshots.clear()
+        if not profiled:
+            logger.error(f"No cProfile data collected for {self.movie_name}, another profiler was already active.")
+        if profiled or traced:
+            logger.info(f"Profile for {self.movie_name} written to {base_path}.*")
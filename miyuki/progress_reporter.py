@@ -0,0 +1,91 @@
+import sys
+import threading
+import time
+from typing import Callable, Optional
+from miyuki.config import PROGRESS_INTERVAL, PROGRESS_LOG_INTERVAL
+from miyuki.logger import logger
+
+
+class WorkerProgress:
+    __slots__ = ('segments', 'bytes')
+
+    def __init__(self) -> None:
+        self.segments = 0
+        self.bytes = 0
+
+
+class ProgressReporter:
+    def __init__(self, total: int, label: Optional[str] = None, enabled: bool = True, initial: int = 0,
+                 active: Optional[Callable[[], int]] = None, interval: Optional[float] = None, live: bool = True):
+        self.total = total
+        self.label = label
+        self.enabled = enabled
+        self.initial = initial
+        self.active = active
+        # Several movies downloading at once would overwrite each other's \r bar, so they log lines instead.
+        self.live = live
+        self.interval = interval or (PROGRESS_INTERVAL if live else PROGRESS_LOG_INTERVAL)
+        self._workers = []
+        self._local = threading.local()
+        self._register_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_time = None
+
+    def _worker(self) -> WorkerProgress:
+        worker = getattr(self._local, 'worker', None)
+        if worker is None:
+            worker = WorkerProgress()
+            with self._register_lock:
+                self._workers.append(worker)
+            self._local.worker = worker
+        return worker
+
+    def record(self, size: int) -> None:
+        worker = self._worker()
+        worker.segments += 1
+        worker.bytes += size
+
+    def snapshot(self) -> tuple[int, int]:
+        workers = list(self._workers)
+        return sum(w.segments for w in workers), sum(w.bytes for w in workers)
+
+    def start(self) -> None:
+        self._start_time = time.monotonic()
+        if not self.enabled:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._render()
+        if self.live:
+            sys.stdout.write('\n')
+            sys.stdout.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._render()
+
+    def _render(self) -> None:
+        segments, received = self.snapshot()
+        elapsed = max(time.monotonic() - self._start_time, 1e-6)
+        done = self.initial + segments
+        segment_rate = segments / elapsed
+        eta = (self.total - done) / segment_rate if segment_rate else 0
+        bar_length = 50
+        block = int(round(bar_length * done / self.total)) if self.total else bar_length
+        prefix = f"{self.label} " if self.label else ""
+        active = f" conns {self.active()}" if self.active else ""
+        stats = (f"{done}/{self.total} {received / elapsed / 1024 / 1024:.2f} MB/s {segment_rate:.1f} seg/s "
+                 f"ETA {int(eta) // 60:02d}:{int(eta) % 60:02d}{active}")
+        if not self.live:
+            logger.info(f"{prefix}Progress: {done * 100 // self.total if self.total else 100}% {stats}")
+            return
+        sys.stdout.write(f"\r{prefix}Progress: [{'#' * block + '-' * (bar_length - block)}] {stats}")
+        sys.stdout.flush()
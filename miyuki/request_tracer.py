@@ -0,0 +1,134 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from miyuki.config import TRACE_MAX_EVENTS
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    __slots__ = ('tracer', 'name', 'category', 'tid', 'start', 'args')
+
+    def __init__(self, tracer: Optional['RequestTracer'], name: str, category: str, tid: int, start: float, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.tid = tid
+        self.start = start
+        self.args = args
+
+    def set(self, **args) -> None:
+        if self.tracer:
+            self.args.update(args)
+
+    def timings(self, connect: float, ttfb: float, total: float) -> None:
+        if not self.tracer:
+            return
+        self.args.update(connect_ms=round(connect * 1000, 3), ttfb_ms=round((ttfb - connect) * 1000, 3), transfer_ms=round((total - ttfb) * 1000, 3))
+        for name, begin, end in [('connect', 0.0, connect), ('ttfb', connect, ttfb), ('transfer', ttfb, total)]:
+            if end > begin:
+                self.tracer.complete(name, 'http', self.tid, self.start + begin * 1e6, (end - begin) * 1e6)
+
+
+NULL_SPAN = Span(None, '', '', 0, 0.0, {})
+
+
+class RequestTracer:
+    def __init__(self, max_events: int = TRACE_MAX_EVENTS):
+        self.enabled = False
+        self.max_events = max_events
+        self.dropped = 0
+        self._events = []
+        self._track_names = {}
+        self._free_lanes = []
+        self._lanes = 0
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self) -> None:
+        self._origin = time.perf_counter()
+        self.enabled = True
+
+    def _now(self) -> float:
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _thread_track(self) -> int:
+        thread = threading.current_thread()
+        if thread.ident not in self._track_names:
+            with self._lock:
+                self._track_names[thread.ident] = thread.name
+        return thread.ident
+
+    def complete(self, name: str, category: str, tid: int, start: float, duration: float, args: Optional[dict] = None) -> None:
+        with self._lock:
+            if len(self._events) >= self.max_events:
+                self.dropped += 1
+                return
+            self._events.append((name, category, tid, start, duration, args))
+
+    @contextmanager
+    def span(self, name: str, category: str, **args):
+        if not self.enabled:
+            yield NULL_SPAN
+            return
+        parent = _current_span.get()
+        if parent and category == 'http':
+            parent.args['attempts'] = parent.args.get('attempts', 0) + 1
+        tid = parent.tid if parent else self._thread_track()
+        span = Span(self, name, category, tid, self._now(), args)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            args['error'] = str(e) or type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            if 'attempts' in args:
+                args['retries'] = args['attempts'] - 1
+            self.complete(name, category, tid, span.start, self._now() - span.start, args)
+
+    @contextmanager
+    def lane(self):
+        """Give an asyncio task its own track: tasks share the event loop thread, so their spans would overlap."""
+        if not self.enabled:
+            yield
+            return
+        with self._lock:
+            if self._free_lanes:
+                lane = self._free_lanes.pop()
+            else:
+                self._lanes += 1
+                lane = self._lanes
+                self._track_names[lane] = f"async-lane-{lane}"
+        token = _current_span.set(Span(self, '', '', lane, 0.0, {}))
+        try:
+            yield
+        finally:
+            _current_span.reset(token)
+            with self._lock:
+                self._free_lanes.append(lane)
+
+    def write(self, path: str) -> None:
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+            track_names = dict(self._track_names)
+        trace_events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'miyuki'}}]
+        trace_events += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}} for tid, name in track_names.items()]
+        for name, category, tid, start, duration, args in events:
+            event = {'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid, 'ts': round(start, 3), 'dur': round(duration, 3)}
+            if args:
+                event['args'] = args
+            trace_events.append(event)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms', 'otherData': {'dropped_events': self.dropped}}, f)
+        os.replace(tmp_path, path)
+
+
+request_tracer = RequestTracer()
@@ -0,0 +1,76 @@
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+from miyuki.config import RETRY, DELAY, RETRY_MAX_DELAY
+
+
+class HttpStatusError(Exception):
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP status {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class IncompleteContentError(Exception):
+    def __init__(self, expected: int, received: int):
+        super().__init__(f"Expected {expected} bytes, received {received}")
+        self.expected = expected
+        self.received = received
+
+
+class RetryPolicy:
+    RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+    def __init__(self, retries: int = RETRY, base_delay: float = DELAY, max_delay: float = RETRY_MAX_DELAY, budget: Optional[int] = None):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.retries_used = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        if value.strip().isdigit():
+            return float(value.strip())
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def check_status(self, response) -> None:
+        if response.status_code >= 400:
+            raise HttpStatusError(response.status_code, self._parse_retry_after(response.headers.get('Retry-After')))
+
+    def check_length(self, response, received: int) -> None:
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and not response.headers.get('Content-Encoding'):
+            if int(content_length) != received:
+                raise IncompleteContentError(int(content_length), received)
+
+    def check_response(self, response) -> None:
+        self.check_status(response)
+        self.check_length(response, len(response.content))
+
+    def should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt + 1 >= self.retries:
+            return False
+        if isinstance(error, HttpStatusError) and error.status_code not in self.RETRYABLE_STATUS and error.status_code < 500:
+            return False
+        with self._lock:
+            if self.budget is not None and self.retries_used >= self.budget:
+                return False
+            self.retries_used += 1
+        return True
+
+    def backoff(self, error: Exception, attempt: int) -> float:
+        if isinstance(error, HttpStatusError) and error.retry_after is not None:
+            return min(error.retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def budget_exhausted(self) -> bool:
+        return self.budget is not None and self.retries_used >= self.budget
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+from miyuki.utils import ThreadSafeCounter
+
+
+class MovieMetrics:
+    def __init__(self, url: str):
+        self.url = url
+        self.movie = url.split('/')[-1]
+        self.status = 'pending'
+        self.error = None
+        self.phases = {}
+        self.bytes = ThreadSafeCounter()
+        self.segments_downloaded = ThreadSafeCounter()
+        self.segments_failed = ThreadSafeCounter()
+        self.requests = ThreadSafeCounter()
+        self.request_errors = ThreadSafeCounter()
+        self.segments_total = 0
+        self.segments_complete = 0
+        self.retries = 0
+        self.hedges_fired = 0
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def record_segment(self, size: Optional[int]) -> None:
+        if size:
+            self.segments_downloaded.increment_and_get()
+            self.bytes.add_and_get(size)
+        else:
+            self.segments_failed.increment_and_get()
+
+    def to_dict(self) -> dict:
+        return {
+            'url': self.url,
+            'movie': self.movie,
+            'status': self.status,
+            'error': self.error,
+            'phases': {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            'seconds': round(sum(self.phases.values()), 4),
+            'bytes': self.bytes.get(),
+            'segments_total': self.segments_total,
+            'segments_complete': self.segments_complete,
+            'segments_downloaded': self.segments_downloaded.get(),
+            'segments_failed': self.segments_failed.get(),
+            'requests': self.requests.get(),
+            'request_errors': self.request_errors.get(),
+            'retries': self.retries,
+            'hedges_fired': self.hedges_fired,
+        }
+
+
+class RunMetrics:
+    def __init__(self):
+        self.started_at = time.time()
+        self.finished_at = None
+        self.movies = []
+        self.http = {}
+        self.memory = {}
+        self._lock = threading.Lock()
+
+    def add(self, metrics: MovieMetrics) -> None:
+        with self._lock:
+            self.movies.append(metrics)
+
+    def finish(self, http_stats: dict, memory: Optional[dict] = None) -> None:
+        self.finished_at = time.time()
+        self.http = http_stats
+        self.memory = memory or {}
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            movies = [metrics.to_dict() for metrics in self.movies]
+        statuses = {}
+        for movie in movies:
+            statuses[movie['status']] = statuses.get(movie['status'], 0) + 1
+        return {
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(self.started_at)),
+            'seconds': round((self.finished_at or time.time()) - self.started_at, 4),
+            'movies': statuses,
+            'bytes': sum(movie['bytes'] for movie in movies),
+            'requests': sum(movie['requests'] for movie in movies),
+            'retries': sum(movie['retries'] for movie in movies),
+            'http': self.http,
+            'memory': self.memory,
+            'per_movie': movies,
+        }
+
+    @staticmethod
+    def _write_atomically(path: str, text: str) -> None:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def write_json(self, path: str) -> None:
+        self._write_atomically(path, json.dumps(self.to_dict(), indent=2) + '\n')
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    @classmethod
+    def _labels(cls, movie: dict) -> str:
+        return f'movie="{cls._escape(movie["movie"])}",url="{cls._escape(movie["url"])}"'
+
+    def write_prometheus(self, path: str) -> None:
+        summary = self.to_dict()
+        # Skipped URLs carry no data, and a URL listed twice must not produce duplicate series.
+        downloaded = list({movie['url']: movie for movie in summary['per_movie'] if movie['status'] != 'skipped'}.values())
+        lines = [
+            '# HELP miyuki_run_duration_seconds Wall time of the last miyuki run.',
+            '# TYPE miyuki_run_duration_seconds gauge',
+            f"miyuki_run_duration_seconds {summary['seconds']}",
+            '# HELP miyuki_run_movies Movies processed in the last run by status.',
+            '# TYPE miyuki_run_movies gauge',
+        ]
+        lines += [f'miyuki_run_movies{{status="{status}"}} {count}' for status, count in summary['movies'].items()]
+        lines += [
+            '# HELP miyuki_run_http_requests HTTP requests served in the last run.',
+            '# TYPE miyuki_run_http_requests gauge',
+            f"miyuki_run_http_requests {summary['http'].get('requests_served', 0)}",
+            '# HELP miyuki_run_http_connections HTTP connections opened in the last run.',
+            '# TYPE miyuki_run_http_connections gauge',
+            f"miyuki_run_http_connections {summary['http'].get('connections_opened', 0)}",
+            '# HELP miyuki_run_buffer_high_water_bytes Peak segment buffer memory in the last run.',
+            '# TYPE miyuki_run_buffer_high_water_bytes gauge',
+            f"miyuki_run_buffer_high_water_bytes {summary['memory'].get('buffer_high_water_bytes', 0)}",
+        ]
+        if summary['memory'].get('peak_rss_bytes'):
+            lines += [
+                '# HELP miyuki_run_peak_rss_bytes Peak resident set size of the last run.',
+                '# TYPE miyuki_run_peak_rss_bytes gauge',
+                f"miyuki_run_peak_rss_bytes {summary['memory']['peak_rss_bytes']}",
+            ]
+        lines += [
+            '# HELP miyuki_movie_phase_seconds Wall time per download phase.',
+            '# TYPE miyuki_movie_phase_seconds gauge',
+        ]
+        for movie in downloaded:
+            lines += [f'miyuki_movie_phase_seconds{{{self._labels(movie)},phase="{phase}"}} {seconds}' for phase, seconds in movie['phases'].items()]
+        for name, key, help_text in [('miyuki_movie_bytes', 'bytes', 'Segment bytes transferred per movie.'),
+                                     ('miyuki_movie_segments_failed', 'segments_failed', 'Segments that could not be downloaded per movie.'),
+                                     ('miyuki_movie_requests', 'requests', 'HTTP requests made per movie.'),
+                                     ('miyuki_movie_request_errors', 'request_errors', 'Failed segment requests per movie.'),
+                                     ('miyuki_movie_retries', 'retries', 'Segment request retries per movie.')]:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            lines += [f'{name}{{{self._labels(movie)}}} {movie[key]}' for movie in downloaded]
+        self._write_atomically(path, '\n'.join(lines) + '\n')
@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+import zlib
+from miyuki.config import MANIFEST_FILE, MANIFEST_FLUSH_INTERVAL
+from miyuki.logger import logger
+
+
+class SegmentManifest:
+    def __init__(self, movie_folder: str, uuid: str, resolution: str, total: int):
+        self.path = os.path.join(movie_folder, MANIFEST_FILE)
+        self.movie_folder = movie_folder
+        self.uuid = uuid
+        self.resolution = resolution
+        self.total = total
+        self.segments = {}
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+    def load(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable manifest {self.path}: {e}")
+            return 0
+        if data.get('uuid') != self.uuid or data.get('resolution') != self.resolution or data.get('total') != self.total:
+            logger.info(f"Manifest {self.path} belongs to a different playlist, starting over.")
+            return 0
+        for index, (size, crc) in data.get('segments', {}).items():
+            if self._verify(int(index), size, crc):
+                self.segments[int(index)] = (size, crc)
+        return len(self.segments)
+
+    def _verify(self, index: int, size: int, crc: int) -> bool:
+        file_path = os.path.join(self.movie_folder, f"video{index}.jpeg")
+        try:
+            if os.path.getsize(file_path) != size:
+                return False
+            with open(file_path, 'rb') as f:
+                return zlib.crc32(f.read()) == crc
+        except OSError:
+            return False
+
+    def is_complete(self, index: int) -> bool:
+        return index in self.segments
+
+    def record(self, index: int, content: bytes) -> None:
+        with self._lock:
+            self.segments[index] = (len(content), zlib.crc32(content))
+            self._unsaved += 1
+            if self._unsaved < MANIFEST_FLUSH_INTERVAL:
+                return
+        self.save()
+
+    def save(self) -> None:
+        with self._lock:
+            data = {
+                'uuid': self.uuid,
+                'resolution': self.resolution,
+                'total': self.total,
+                'segments': {str(index): list(entry) for index, entry in self.segments.items()},
+            }
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self._unsaved = 0
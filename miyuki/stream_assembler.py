@@ -0,0 +1,90 @@
+import os
+import threading
+from typing import BinaryIO
+from miyuki.config import STREAM_MEMORY_BUDGET
+from miyuki.logger import logger
+
+
+class StreamAssembler:
+    def __init__(self, sink: BinaryIO, spill_folder: str, total: int, memory_budget: int = STREAM_MEMORY_BUDGET):
+        self.sink = sink
+        self.spill_folder = spill_folder
+        self.total = total
+        self.memory_budget = memory_budget
+        self.next_index = 0
+        self.written = 0
+        self.buffered_bytes = 0
+        self.failed = False
+        self._buffer = {}
+        self._spilled = set()
+        self._skipped = set()
+        self._lock = threading.Lock()
+
+    def _spill_path(self, index: int) -> str:
+        return os.path.join(self.spill_folder, f"video{index}.jpeg")
+
+    def _spill(self, index: int, content: bytes) -> None:
+        with open(self._spill_path(index), 'wb') as f:
+            f.write(content)
+
+    def submit(self, index: int, content: bytes) -> None:
+        with self._lock:
+            if index == self.next_index:
+                self._write(index, content)
+                self._drain()
+            elif self.buffered_bytes + len(content) <= self.memory_budget:
+                self._buffer[index] = bytes(content)
+                self.buffered_bytes += len(content)
+            else:
+                self._spill(index, content)
+                self._spilled.add(index)
+
+    def skip(self, index: int) -> None:
+        with self._lock:
+            self._skipped.add(index)
+            self._drain()
+
+    def _write(self, index: int, content: bytes) -> None:
+        if not self.failed:
+            try:
+                self.sink.write(content)
+                self.written += 1
+            except (OSError, ValueError) as e:
+                logger.error(f"Stream output failed at segment {index}: {e}")
+                self.failed = True
+        if self.failed:
+            self._spill(index, content)
+        self.next_index += 1
+
+    def _drain(self) -> None:
+        while self.next_index < self.total:
+            index = self.next_index
+            if index in self._buffer:
+                content = self._buffer.pop(index)
+                self.buffered_bytes -= len(content)
+                self._write(index, content)
+            elif index in self._spilled:
+                self._spilled.discard(index)
+                if self.failed:
+                    self.next_index += 1
+                    continue
+                spill_path = self._spill_path(index)
+                with open(spill_path, 'rb') as f:
+                    self._write(index, f.read())
+                if not self.failed:
+                    os.remove(spill_path)
+            elif index in self._skipped:
+                self._skipped.discard(index)
+                self.next_index += 1
+            else:
+                return
+
+    def close(self) -> int:
+        with self._lock:
+            self._drain()
+            try:
+                self.sink.close()
+            except OSError as e:
+                logger.error(f"Failed to close stream output: {e}")
+                self.failed = True
+            return self.written
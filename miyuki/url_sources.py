@@ -1,9 +1,14 @@
 from abc import ABC, abstractmethod
+import math
 import re
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+from urllib.parse import urljoin
 from miyuki.http_client import HttpClient
-from miyuki.config import HREF_REGEX_PUBLIC_PLAYLIST, HREF_REGEX_NEXT_PAGE, MATCH_UUID_PATTERN
+from miyuki.config import HREF_REGEX_PUBLIC_PLAYLIST, HREF_REGEX_NEXT_PAGE, HREF_REGEX_PAGE_NUMBER, MATCH_PAGE_PARAM, MATCH_UUID_PATTERN, CRAWL_CONCURRENCY
 from miyuki.logger import logger
+from miyuki.page_cache import page_cache
+from miyuki.request_tracer import request_tracer
 from miyuki.utils import ThreadSafeCounter
 from enum import Enum
 
@@ -13,9 +18,12 @@ class UrlType(Enum):
 
 class UrlSource(ABC):
     @abstractmethod
-    def get_urls(self) -> list[str]:
+    def iter_urls(self) -> Iterator[str]:
         pass
 
+    def get_urls(self) -> list[str]:
+        return list(self.iter_urls())
+
     @staticmethod
     def movie_count_log(movie_counter: ThreadSafeCounter, movie_url: str):
         logger.info(f"Movie {movie_counter.increment_and_get()} url: {movie_url}")
@@ -25,36 +33,83 @@ class SingleUrlSource(UrlSource):
         self.movie_counter = movie_counter
         self.urls = urls
 
-    def get_urls(self) -> list[str]:
+    def iter_urls(self) -> Iterator[str]:
         for url in self.urls:
             self.movie_count_log(self.movie_counter, url)
-        return self.urls
+            yield url
+
+class PagedSource(UrlSource):
+    http_client: HttpClient
+    movie_counter: ThreadSafeCounter
+
+    def _fetch_page(self, url: str, cookies: Optional[dict]) -> Optional[str]:
+        with request_tracer.span('page', 'crawl', url=url) as span:
+            html_source = self.http_client.get(url, cookies=cookies)
+            span.set(bytes=len(html_source) if html_source is not None else 0)
+        return html_source.decode('utf-8') if html_source is not None else None
+
+    @staticmethod
+    def _next_page_url(html_source: str, page_url: str) -> Optional[str]:
+        next_page_matches = re.findall(HREF_REGEX_NEXT_PAGE, html_source)
+        return urljoin(page_url, next_page_matches[0].replace('&amp;', '&')) if next_page_matches else None
+
+    @staticmethod
+    def _page_movie_urls(html_source: str) -> list[str]:
+        return list(dict.fromkeys(re.findall(HREF_REGEX_PUBLIC_PLAYLIST, html_source)))
+
+    def _crawl(self, url: str, limit: Optional[int], cookies: Optional[dict] = None) -> Iterator[str]:
+        html_source = self._fetch_page(url, cookies)
+        if html_source is None:
+            return
+        movie_urls = self._page_movie_urls(html_source)
+        per_page = max(1, len(movie_urls))
+        count = 0
+        for movie_url in movie_urls[:limit]:
+            count += 1
+            self.movie_count_log(self.movie_counter, movie_url)
+            yield movie_url
+        next_url = self._next_page_url(html_source, url)
+        if not next_url or not re.search(MATCH_PAGE_PARAM, next_url):
+            yield from self._crawl_serially(next_url, count, limit, cookies)
+            return
+        last_page = max(map(int, re.findall(HREF_REGEX_PAGE_NUMBER, html_source)), default=2)
+        page = 2
+        with ThreadPoolExecutor(max_workers=CRAWL_CONCURRENCY, thread_name_prefix='crawl') as executor:
+            while not limit or count < limit:
+                window = CRAWL_CONCURRENCY if page > last_page else min(CRAWL_CONCURRENCY, last_page - page + 1)
+                if limit:
+                    window = min(window, math.ceil((limit - count) / per_page))
+                page_urls = [re.sub(MATCH_PAGE_PARAM, rf'\g<1>{n}', next_url) for n in range(page, page + window)]
+                for html_source in executor.map(lambda page_url: self._fetch_page(page_url, cookies), page_urls):
+                    movie_urls = self._page_movie_urls(html_source) if html_source is not None else []
+                    for movie_url in movie_urls[:limit - count if limit else None]:
+                        count += 1
+                        self.movie_count_log(self.movie_counter, movie_url)
+                        yield movie_url
+                    if not movie_urls or (limit and count >= limit) or not self._next_page_url(html_source, next_url):
+                        return
+                page += window
+
+    def _crawl_serially(self, url: Optional[str], count: int, limit: Optional[int], cookies: Optional[dict]) -> Iterator[str]:
+        while url and (limit is None or count < limit):
+            html_source = self._fetch_page(url, cookies)
+            if html_source is None:
+                break
+            for movie_url in self._page_movie_urls(html_source)[:limit - count if limit else None]:
+                count += 1
+                self.movie_count_log(self.movie_counter, movie_url)
+                yield movie_url
+            url = self._next_page_url(html_source, url)
 
-class PlaylistSource(UrlSource):
+class PlaylistSource(PagedSource):
     def __init__(self, movie_counter: ThreadSafeCounter, playlist_url: str, limit: Optional[str]):
         self.movie_counter = movie_counter
         self.playlist_url = playlist_url
         self.limit = int(limit) if limit else None
         self.http_client = HttpClient()
 
-    def get_urls(self) -> list[str]:
-        movie_url_list = []
-        url = self.playlist_url
-        while url and (self.limit is None or len(movie_url_list) < self.limit):
-            html_source = self.http_client.get(url)
-            if html_source is None:
-                break
-            html_source = html_source.decode('utf-8')
-            movie_url_matches = re.findall(HREF_REGEX_PUBLIC_PLAYLIST, html_source)
-            temp_url_list = list(set(movie_url_matches))
-            for movie_url in temp_url_list:
-                movie_url_list.append(movie_url)
-                self.movie_count_log(self.movie_counter, movie_url)
-                if self.limit and len(movie_url_list) >= self.limit:
-                    return movie_url_list[:self.limit]
-            next_page_matches = re.findall(HREF_REGEX_NEXT_PAGE, html_source)
-            url = next_page_matches[0].replace('&amp;', '&') if next_page_matches else None
-        return movie_url_list
+    def iter_urls(self) -> Iterator[str]:
+        return self._crawl(self.playlist_url, self.limit)
 
 class AutoUrlSource(UrlSource):
     def __init__(self, movie_counter: ThreadSafeCounter, auto_urls: list[str], limit: Optional[int]):
@@ -63,27 +118,26 @@ class AutoUrlSource(UrlSource):
         self.limit = int(limit) if limit else None
         self.http_client = HttpClient()
 
-    def get_urls(self) -> list[str]:
-        movie_url_list = []
+    def iter_urls(self) -> Iterator[str]:
+        url_total_now = 0
 
         need_url_total_now = self.limit
 
         for url in self.auto_urls:
 
             if need_url_total_now is not None:
-                need_url_total_now = self.limit - len(movie_url_list)
+                need_url_total_now = self.limit - url_total_now
                 if need_url_total_now == 0:
                     break
 
             url_type : UrlType = self._determine_url_type(url)
             if url_type == UrlType.SINGLE:
                 playlist_source = SingleUrlSource(self.movie_counter, [url])
-                movie_url_list.extend(playlist_source.get_urls())
             else:
                 playlist_source = PlaylistSource(self.movie_counter, url, need_url_total_now)
-                movie_url_list.extend(playlist_source.get_urls())
-
-        return movie_url_list
+            for movie_url in playlist_source.iter_urls():
+                url_total_now += 1
+                yield movie_url
 
     def _determine_url_type(self, url: str) -> Optional[UrlType]:
         if self._is_movie_url(url):
@@ -92,7 +146,7 @@ class AutoUrlSource(UrlSource):
             return UrlType.PLAYLIST
 
     def _is_movie_url(self, url: str) -> bool:
-        html = self.http_client.get(url)
+        html = page_cache.fetch(url, self.http_client.get)
         if not html:
             return False
         html = html.decode('utf-8')
@@ -101,7 +155,7 @@ class AutoUrlSource(UrlSource):
             return False
         return True
 
-class AuthSource(UrlSource):
+class AuthSource(PagedSource):
     def __init__(self, movie_counter: ThreadSafeCounter, username: str, password: str):
         self.movie_counter = movie_counter
         self.http_client = HttpClient()
@@ -117,23 +171,8 @@ class AuthSource(UrlSource):
         logger.error("Login failed, check your network connection or account information.")
         exit(114514)
 
-    def get_urls(self) -> list[str]:
-        movie_url_list = []
-        url = 'https://missav.ai/saved'
-        while url:
-            html_source = self.http_client.get(url, cookies=self.cookie)
-            if html_source is None:
-                break
-            html_source = html_source.decode('utf-8')
-            movie_url_matches = re.findall(HREF_REGEX_PUBLIC_PLAYLIST, html_source)
-            temp_url_list = list(set(movie_url_matches))
-            for movie_url in temp_url_list:
-                movie_url_list.append(movie_url)
-                self.movie_count_log(self.movie_counter, movie_url)
-                # logger.info(f"Movie {len(movie_url_list)} url: {movie_url}")
-            next_page_matches = re.findall(HREF_REGEX_NEXT_PAGE, html_source)
-            url = next_page_matches[0].replace('&amp;', '&') if next_page_matches else None
-        return movie_url_list
+    def iter_urls(self) -> Iterator[str]:
+        return self._crawl('https://missav.ai/saved', None, cookies=self.cookie)
 
 class SearchSource(UrlSource):
     def __init__(self, movie_counter: ThreadSafeCounter, key: str):
@@ -141,31 +180,32 @@ class SearchSource(UrlSource):
         self.key = key
         self.http_client = HttpClient()
 
-    def get_urls(self) -> list[str]:
+    def iter_urls(self) -> Iterator[str]:
         search_url = f"https://missav.ai/search/{self.key}"
         search_regex = r'<a href="([^"]+)" alt="' + self.key + '" >'
         html_source = self.http_client.get(search_url)
         if html_source is None:
             logger.error(f"Search failed, key: {self.key}")
-            return []
+            return
         html_source = html_source.decode('utf-8')
         movie_url_matches = re.findall(search_regex, html_source)
         temp_url_list = list(set(movie_url_matches))
         if temp_url_list:
             logger.info(f"Search {self.key} successfully: {temp_url_list[0]}")
             self.movie_count_log(self.movie_counter, temp_url_list[0])
-            return [temp_url_list[0]]
+            yield temp_url_list[0]
+            return
         logger.error(f"Search failed, key: {self.key}")
-        return []
 
 class FileSource(UrlSource):
     def __init__(self, movie_counter: ThreadSafeCounter, file_path: str):
         self.movie_counter = movie_counter
         self.file_path = file_path
 
-    def get_urls(self) -> list[str]:
+    def iter_urls(self) -> Iterator[str]:
         with open(self.file_path, 'r', encoding='utf-8') as f:
-            urls = [line.strip() for line in f.readlines() if line.strip()]
-        for url in urls:
-            self.movie_count_log(self.movie_counter, url)
-        return urls
\ No newline at end of file
+            for line in f:
+                url = line.strip()
+                if url:
+                    self.movie_count_log(self.movie_counter, url)
+                    yield url
\ No newline at end of file
@@ -1,8 +1,11 @@
+import asyncio
 import threading
-import sys
 import os
 import shutil
-from typing import Tuple
+import sys
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional
+from miyuki.config import COPY_BUFFER_SIZE
 
 
 class ThreadSafeCounter:
@@ -15,28 +18,96 @@ class ThreadSafeCounter:
             self._count += 1
             return self._count
 
+    def add_and_get(self, value: int) -> int:
+        with self._lock:
+            self._count += value
+            return self._count
+
+    def get(self) -> int:
+        with self._lock:
+            return self._count
+
     def reset(self) -> None:
         with self._lock:
             self._count = 0
 
 
-def display_progress_bar(max_value: int, file_counter: ThreadSafeCounter) -> None:
-    bar_length = 50
-    current_value = file_counter.increment_and_get()
-    progress = current_value / max_value
-    block = int(round(bar_length * progress))
-    text = f"\rProgress: [{'#' * block + '-' * (bar_length - block)}] {current_value}/{max_value}"
-    sys.stdout.write(text)
-    sys.stdout.flush()
+class AsyncWaiters:
+    """Wakes asyncio tasks, on any event loop, when another thread releases a shared resource."""
+
+    def __init__(self) -> None:
+        self._waiters = []
+        self._lock = threading.Lock()
+
+    async def wait_for(self, try_acquire) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            waiter = (loop, loop.create_future())
+            with self._lock:
+                self._waiters.append(waiter)
+            try:
+                # Registered before trying, so a release in between still wakes this task.
+                if try_acquire():
+                    return
+                await waiter[1]
+            finally:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+
+    def notify(self) -> None:
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(self._wake, future)
+            except RuntimeError:
+                # The waiter's event loop is already closed.
+                pass
 
+    @staticmethod
+    def _wake(future: asyncio.Future) -> None:
+        if not future.done():
+            future.set_result(None)
 
-def split_integer_into_intervals(integer: int, n: int) -> list[Tuple[int, int]]:
-    interval_size = integer // n
-    remainder = integer % n
-    intervals = [(i * interval_size, (i + 1) * interval_size) for i in range(n)]
-    if remainder:
-        intervals[-1] = (intervals[-1][0], intervals[-1][1] + remainder)
-    return intervals
+
+class ConnectionBudget:
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._waiters = AsyncWaiters()
+
+    @contextmanager
+    def slot(self):
+        self._semaphore.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def try_acquire(self) -> bool:
+        return self._semaphore.acquire(blocking=False)
+
+    def release(self) -> None:
+        self._semaphore.release()
+        self._waiters.notify()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        await self._waiters.wait_for(self.try_acquire)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+def peak_rss() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
 
 
 def find_last_non_empty_line(text: str) -> str:
@@ -65,3 +136,44 @@ def delete_all_subfolders(folder_path: str) -> None:
         item_path = os.path.join(folder_path, item)
         if os.path.isdir(item_path):
             shutil.rmtree(item_path)
+
+
+_unsupported_copy_methods = set()
+
+
+def _copy_with_syscall(infile, outfile, size: int) -> bool:
+    for method in ('copy_file_range', 'sendfile'):
+        copy = getattr(os, method, None)
+        if copy is None or method in _unsupported_copy_methods:
+            continue
+        copied = 0
+        try:
+            while copied < size:
+                if method == 'copy_file_range':
+                    sent = copy(infile.fileno(), outfile.fileno(), size - copied)
+                else:
+                    sent = copy(outfile.fileno(), infile.fileno(), copied, size - copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError:
+            if copied:
+                raise
+            _unsupported_copy_methods.add(method)
+            continue
+        if copied < size:
+            # sendfile leaves the input offset alone, so point it past the bytes already copied.
+            infile.seek(copied)
+            return False
+        return True
+    return False
+
+
+def concat_files(output_file: str, input_files: list[str]) -> int:
+    with open(output_file, 'wb', buffering=0) as outfile:
+        for file_path in input_files:
+            with open(file_path, 'rb', buffering=0) as infile:
+                size = os.fstat(infile.fileno()).st_size
+                if not _copy_with_syscall(infile, outfile, size):
+                    shutil.copyfileobj(infile, outfile, COPY_BUFFER_SIZE)
+        return outfile.tell()
@@ -1,16 +1,37 @@
+import asyncio
+import math
 import os
 import re
+import shutil
 from typing import Optional, Tuple
+import queue
 import threading
-from miyuki.config import MOVIE_SAVE_PATH_ROOT, MATCH_UUID_PATTERN, MATCH_TITLE_PATTERN, COVER_URL_PREFIX, TMP_HTML_FILE, RESOLUTION_PATTERN, VIDEO_M3U8_PREFIX, VIDEO_PLAYLIST_SUFFIX
-from miyuki.http_client import HttpClient
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from miyuki.config import MOVIE_SAVE_PATH_ROOT, MATCH_UUID_PATTERN, MATCH_TITLE_PATTERN, COVER_URL_PREFIX, TMP_HTML_FILE, FFMPEG_INPUT_FILE, RESOLUTION_PATTERN, VIDEO_M3U8_PREFIX, VIDEO_PLAYLIST_SUFFIX, PREALLOC_STATE_SUFFIX, ASYNC_CONCURRENCY, RETRY_BUDGET_RATIO, RETRY_BUDGET_MIN, RANGE_SPLIT_MAX_PARTS
+from miyuki.http_client import HttpClient, AsyncHttpClient
 from miyuki.logger import logger
-from miyuki.utils import ThreadSafeCounter, display_progress_bar, split_integer_into_intervals, find_last_non_empty_line, find_closest
+from miyuki.page_cache import page_cache
+from miyuki.request_tracer import request_tracer
+from miyuki.utils import ThreadSafeCounter, ConnectionBudget, find_last_non_empty_line, find_closest, concat_files
 from miyuki.ffmpeg_processor import FFmpegProcessor
+from miyuki.segment_manifest import SegmentManifest
+from miyuki.stream_assembler import StreamAssembler
+from miyuki.preallocated_output import PreallocatedOutput
+from miyuki.concurrency_controller import ConcurrencyController
+from miyuki.retry_policy import RetryPolicy
+from miyuki.progress_reporter import ProgressReporter
+from miyuki.m3u8_parser import MediaPlaylist, Segment, parse_media_playlist
+from miyuki.hedging import LatencyTracker
+from miyuki.buffer_pool import BufferPool, PooledBuffer
+from miyuki.metadata_cache import MetadataCache
+from miyuki.run_metrics import MovieMetrics
+from miyuki.profiler import MovieProfiler
 
 
 class VideoDownloader:
-    def __init__(self, url: str, http_client: HttpClient, options: dict):
+    def __init__(self, url: str, http_client: HttpClient, options: dict, budget: Optional[ConnectionBudget] = None, buffers: Optional[BufferPool] = None, metadata_cache: Optional[MetadataCache] = None):
         self.url = url
         self.http_client = http_client
         self.movie_name = url.split('/')[-1]
@@ -19,15 +40,41 @@ class VideoDownloader:
         self.uuid = None
         self.title = None
         self.final_file_name = None
-        self.counter = ThreadSafeCounter()
+        self.manifest = None
+        self.assembler = None
+        self.output: Optional[PreallocatedOutput] = None
+        self.ffmpeg_process = None
+        self.budget = budget if budget else ConnectionBudget(http_client.pool_size)
+        self.buffers = buffers if buffers else BufferPool()
+        self.metadata_cache = metadata_cache
+        self.m3u8_prefix = VIDEO_M3U8_PREFIX
+        self.metrics = MovieMetrics(url)
+        self.profiler: Optional[MovieProfiler] = None
+        self.controller = None
+        self.retry_policy = None
+        self.progress = None
+        self.playlist: Optional[MediaPlaylist] = None
+        self.latency = LatencyTracker()
+        self.hedge_executor = None
+        self._task_queue = None
+        self._async_remaining = 0
+
+    def clean(self) -> None:
+        shutil.rmtree(self.movie_folder, ignore_errors=True)
 
     def _fetch_metadata(self) -> bool:
-        html = self.http_client.get(self.url)
+        cached = self.metadata_cache.get_movie(self.url) if self.metadata_cache else None
+        if cached:
+            self.uuid, self.title = cached
+            logger.info(f"Using cached metadata for {self.movie_name}: {self.uuid}")
+            return True
+        html = page_cache.fetch(self.url, lambda url: self.http_client.get(url, request_counter=self.metrics.requests))
         if not html:
             logger.error(f"Failed to fetch HTML for {self.url}")
             return False
         html = html.decode('utf-8')
-        with open(TMP_HTML_FILE, 'w', encoding='utf-8') as file:
+        os.makedirs(self.movie_folder, exist_ok=True)
+        with open(os.path.join(self.movie_folder, TMP_HTML_FILE), 'w', encoding='utf-8') as file:
             file.write(html)
         match = re.search(MATCH_UUID_PATTERN, html)
         if not match:
@@ -46,13 +93,30 @@ class VideoDownloader:
             if "uncensored" in self.url:
                 safe_title += "_uncensored"
             self.title = safe_title
+        if self.metadata_cache:
+            self.metadata_cache.put_movie(self.url, self.uuid, self.title)
         return True
 
+    def _fetch_playlist(self, url: str, key: str) -> Optional[str]:
+        if self.metadata_cache:
+            cached = self.metadata_cache.get_playlist(self.url, key)
+            if cached:
+                return cached
+        content = self.http_client.get(url, request_counter=self.metrics.requests)
+        if not content:
+            if self.metadata_cache:
+                self.metadata_cache.invalidate(self.url)
+            return None
+        content = content.decode('utf-8')
+        if self.metadata_cache:
+            self.metadata_cache.put_playlist(self.url, key, content)
+        return content
+
     def _download_cover(self) -> None:
         if not self.options.get('cover_action'):
             return
         cover_url = f"{COVER_URL_PREFIX}{self.movie_name}/cover-n.jpg"
-        cover_content = self.http_client.get(cover_url)
+        cover_content = self.http_client.get(cover_url, request_counter=self.metrics.requests)
         if cover_content:
             cover_path = os.path.join(MOVIE_SAVE_PATH_ROOT, f"{self.movie_name}-cover.jpg")
             with open(cover_path, 'wb') as f:
@@ -80,80 +144,443 @@ class VideoDownloader:
             resolution_url = url_type_x if url_type_x in playlist else url_type_p if url_type_p in playlist else find_last_non_empty_line(playlist)
         return final_quality, resolution_url
 
-    def _thread_task(self, start: int, end: int, uuid: str, resolution: str, video_offset_max: int) -> None:
-        for i in range(start, end):
-            url = f"https://surrit.com/{uuid}/{resolution}/video{i}.jpeg"
-            content = self.http_client.get(url, retries=self.options.get('retry', 5), delay=self.options.get('delay', 2), timeout=self.options.get('timeout', 10))
+    def _snapshot(self, label: str) -> None:
+        if self.profiler:
+            self.profiler.snapshot(label)
+
+    def _worker(self, task_queue: queue.Queue) -> None:
+        with self.profiler.profile() if self.profiler else nullcontext():
+            self._thread_task(task_queue)
+
+    def _thread_task(self, task_queue: queue.Queue) -> None:
+        while True:
+            try:
+                i = task_queue.get_nowait()
+            except queue.Empty:
+                return
+            segment = self.playlist[i]
+            with request_tracer.span(f"segment {i}", 'segment', movie=self.movie_name, segment=i):
+                with self.controller.slot(), self.budget.slot():
+                    content = None
+                    if self._should_split(segment):
+                        content = self._fetch_split(segment)
+                    if content is None:
+                        content = self._fetch_hedged(segment) if self.hedge_executor else self._get_segment(segment)
+                self._save_segment(i, content)
+
+    def _queued_segments(self) -> int:
+        if self._task_queue is not None:
+            return self._task_queue.qsize()
+        return self._async_remaining - self.controller.in_flight
+
+    def _in_tail(self) -> bool:
+        return self._queued_segments() < self.controller.maximum
+
+    def _record_request_error(self, error: Exception) -> None:
+        self.controller.record_error(error)
+        self.metrics.request_errors.increment_and_get()
+
+    def _get_segment(self, segment: Segment, cancelled: Optional[threading.Event] = None) -> Optional[PooledBuffer]:
+        start = time.monotonic()
+        with request_tracer.span('fetch', 'segment', segment=segment.index) as span:
+            content = self.http_client.get_into(segment.uri, self.buffers, headers=segment.range_header(), timeout=self.options.get('timeout', 10), on_error=self._record_request_error, policy=self.retry_policy, cancelled=cancelled, request_counter=self.metrics.requests)
+            span.set(bytes=len(content) if content is not None else 0)
+        if content is not None:
+            self.latency.record(time.monotonic() - start)
+        return content
+
+    @staticmethod
+    def _release_result(future) -> None:
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            future.result().release()
+
+    def _fetch_hedged(self, segment: Segment) -> Optional[PooledBuffer]:
+        threshold = self.latency.threshold()
+        if threshold is None:
+            return self._get_segment(segment)
+        cancelled = threading.Event()
+        primary = self.hedge_executor.submit(self._get_segment, segment, cancelled)
+        while True:
+            try:
+                return primary.result(timeout=threshold)
+            except FutureTimeoutError:
+                if self._in_tail():
+                    break
+        if not self._try_extra_slot():
+            return primary.result()
+        self.latency.hedges_fired.increment_and_get()
+        hedge = self.hedge_executor.submit(self._get_segment, segment, cancelled)
+        # The worker's slot is freed as soon as it returns, so the hedge slot stays taken until both requests finish.
+        running = ThreadSafeCounter()
+        running.add_and_get(2)
+
+        def request_done(_) -> None:
+            if running.add_and_get(-1) == 0:
+                self._release_extra_slot()
+
+        primary.add_done_callback(request_done)
+        hedge.add_done_callback(request_done)
+        for future in as_completed([primary, hedge]):
+            content = future.result()
+            if content is not None:
+                if future is hedge:
+                    self.latency.hedges_won.increment_and_get()
+                cancelled.set()
+                loser = primary if future is hedge else hedge
+                loser.cancel()
+                loser.add_done_callback(self._release_result)
+                return content
+        return None
+
+    def _try_extra_slot(self) -> bool:
+        if not self.budget.try_acquire():
+            return False
+        if not self.controller.try_acquire():
+            self.budget.release()
+            return False
+        return True
+
+    def _release_extra_slot(self) -> None:
+        self.controller.release()
+        self.budget.release()
+
+    def _should_split(self, segment: Segment) -> bool:
+        return bool(self.options.get('split_threshold')) and segment.byte_range is None and self._in_tail()
+
+    def _fetch_split(self, segment: Segment) -> Optional[PooledBuffer]:
+        threshold = self.options['split_threshold']
+        timeout = self.options.get('timeout', 10)
+        size = self.http_client.content_length(segment.uri, timeout=timeout, request_counter=self.metrics.requests)
+        if not size or size <= threshold:
+            return None
+        # The caller's slot covers the first part; every further part needs its own.
+        extra_slots = 0
+        while extra_slots < min(RANGE_SPLIT_MAX_PARTS, math.ceil(size / threshold)) - 1 and self._try_extra_slot():
+            extra_slots += 1
+        if not extra_slots:
+            return None
+        parts = extra_slots + 1
+        part_size = math.ceil(size / parts)
+
+        def fetch_part(start: int) -> bool:
+            end = min(start + part_size, size) - 1
+            content = self.http_client.get(segment.uri, headers={'Range': f"bytes={start}-{end}"}, timeout=timeout, on_error=self._record_request_error, policy=self.retry_policy, request_counter=self.metrics.requests)
+            if content is None or len(content) != end - start + 1:
+                return False
+            view[start:end + 1] = content
+            return True
+
+        try:
+            buffer = self.buffers.acquire(size)
+            buffer.size = size
+            view = buffer.view()
+            with ThreadPoolExecutor(max_workers=parts, thread_name_prefix=f"{self.movie_name}-split") as executor:
+                succeeded = all(executor.map(fetch_part, range(0, size, part_size)))
+            view.release()
+        finally:
+            for _ in range(extra_slots):
+                self._release_extra_slot()
+        if succeeded:
+            return buffer
+        buffer.release()
+        return None
+
+    def _save_segment(self, i: int, buffer: Optional[PooledBuffer]) -> None:
+        content = buffer.view() if buffer is not None else None
+        self.metrics.record_segment(len(content) if content is not None else None)
+        try:
+            self._write_segment(i, content)
+        finally:
+            if content is not None:
+                content.release()
+            if buffer is not None:
+                buffer.release()
+
+    def _write_segment(self, i: int, content: Optional[memoryview]) -> None:
+        if content:
+            self.controller.record_success(len(content))
+        if self.output:
+            if content and self.output.write(i, content):
+                self.progress.record(len(content))
+            else:
+                logger.error(f"Failed to download segment {i} for {self.movie_name}")
+        elif self.assembler:
             if content:
-                file_path = os.path.join(self.movie_folder, f"video{i}.jpeg")
-                with open(file_path, 'wb') as f:
-                    f.write(content)
-                display_progress_bar(video_offset_max + 1, self.counter)
+                self.assembler.submit(i, content)
+                self.progress.record(len(content))
             else:
+                self.assembler.skip(i)
                 logger.error(f"Failed to download segment {i} for {self.movie_name}")
+        elif content:
+            file_path = os.path.join(self.movie_folder, f"video{i}.jpeg")
+            with open(file_path, 'wb') as f:
+                f.write(content)
+            if self.manifest:
+                self.manifest.record(i, content)
+            self.progress.record(len(content))
+        else:
+            logger.error(f"Failed to download segment {i} for {self.movie_name}")
+
+    async def _async_task(self, client: AsyncHttpClient, semaphore: asyncio.Semaphore, i: int) -> None:
+        segment = self.playlist[i]
+        async with semaphore:
+            with request_tracer.lane(), request_tracer.span(f"segment {i}", 'segment', movie=self.movie_name, segment=i):
+                async with self.controller.async_slot(), self.budget.async_slot():
+                    if self.options.get('hedge'):
+                        content = await self._async_fetch_hedged(client, segment)
+                    else:
+                        content = await self._async_get_segment(client, segment)
+                self._async_remaining -= 1
+                # Disk writes and -ffpipe writes into ffmpeg's stdin block, keep them off the event loop.
+                await asyncio.to_thread(self._save_segment, i, content)
 
-    def _download_segments(self, uuid: str, resolution: str, video_offset_max: int) -> None:
+    async def _async_get_segment(self, client: AsyncHttpClient, segment: Segment) -> Optional[PooledBuffer]:
+        start = time.monotonic()
+        with request_tracer.span('fetch', 'segment', segment=segment.index) as span:
+            content = await client.get_into(segment.uri, self.buffers, headers=segment.range_header(), timeout=self.options.get('timeout', 10), on_error=self._record_request_error, policy=self.retry_policy, request_counter=self.metrics.requests)
+            span.set(bytes=len(content) if content is not None else 0)
+        if content is not None:
+            self.latency.record(time.monotonic() - start)
+        return content
+
+    async def _async_get_hedge(self, client: AsyncHttpClient, segment: Segment) -> Optional[PooledBuffer]:
+        with request_tracer.lane():
+            return await self._async_get_segment(client, segment)
+
+    async def _async_fetch_hedged(self, client: AsyncHttpClient, segment: Segment) -> Optional[PooledBuffer]:
+        threshold = self.latency.threshold()
+        primary = asyncio.ensure_future(self._async_get_segment(client, segment))
+        if threshold is None:
+            return await primary
+        while True:
+            done, _ = await asyncio.wait({primary}, timeout=threshold)
+            if done:
+                return primary.result()
+            if self._in_tail():
+                break
+        if not self._try_extra_slot():
+            return await primary
+        self.latency.hedges_fired.increment_and_get()
+        hedge = asyncio.ensure_future(self._async_get_hedge(client, segment))
+        hedge.add_done_callback(lambda _: self._release_extra_slot())
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((task for task in done if task.result() is not None), None)
+            if winner:
+                if winner is hedge:
+                    self.latency.hedges_won.increment_and_get()
+                for other in ({primary, hedge} - {winner}):
+                    other.cancel()
+                    other.add_done_callback(self._release_result)
+                return winner.result()
+        return None
+
+    def _pending_segments(self, skip_existing: bool = False) -> list[int]:
+        existing = set(os.listdir(self.movie_folder)) if skip_existing else set()
+        return [i for i in range(len(self.playlist)) if not (self.manifest and self.manifest.is_complete(i)) and not (self.output and self.output.is_complete(i)) and f"video{i}.jpeg" not in existing]
+
+    async def _async_download(self, skip_existing: bool) -> None:
+        concurrency = self.controller.maximum
+        semaphore = asyncio.Semaphore(concurrency)
+        pending_segments = self._pending_segments(skip_existing)
+        self._async_remaining = len(pending_segments)
+        async with AsyncHttpClient(max_clients=concurrency) as client:
+            await asyncio.gather(*(self._async_task(client, semaphore, i) for i in pending_segments))
+            stats = client.stats()
+        self.http_client.connections_opened.add_and_get(stats['connections_opened'])
+        self.http_client.requests_served.add_and_get(stats['requests_served'])
+        logger.info(f"Async engine connections opened: {stats['connections_opened']}, requests served: {stats['requests_served']}")
+
+    def _download_segments(self, skip_existing: bool = False) -> None:
         if not self.options.get('download_action'):
             return
-        intervals = split_integer_into_intervals(video_offset_max + 1, self.options.get('num_threads', os.cpu_count()))
-        self.counter.reset()
+        if self.manifest:
+            completed = self.manifest.load()
+            if completed:
+                logger.info(f"Resuming {self.movie_name}: {completed}/{len(self.playlist)} segments already on disk.")
+        elif self.output and self.output.completed:
+            logger.info(f"Resuming {self.movie_name}: {self.output.completed}/{len(self.playlist)} segments already in {self.output.part_file}.")
+        default_workers = ASYNC_CONCURRENCY if self.options.get('engine') == 'async' else os.cpu_count()
+        self.controller = ConcurrencyController(self.options.get('num_workers') or default_workers, adaptive=self.options.get('adaptive', False), label=self.movie_name)
+        retry_budget = max(RETRY_BUDGET_MIN, int(len(self.playlist) * RETRY_BUDGET_RATIO))
+        self.retry_policy = RetryPolicy(self.options.get('retry', 5), self.options.get('delay', 2), budget=retry_budget)
+        self.progress = ProgressReporter(len(self.playlist), label=self.movie_name if self.options.get('parallel', 1) > 1 else None,
+                                         enabled=self.options.get('progress', True), initial=len(self.manifest.segments) if self.manifest else self.output.completed if self.output else 0,
+                                         active=lambda: self.controller.in_flight, live=self.options.get('parallel', 1) <= 1)
+        self.progress.start()
+        if self.options.get('engine') == 'async':
+            asyncio.run(self._async_download(skip_existing))
+            self._finish_download_segments()
+            return
+        task_queue = queue.Queue()
+        for i in self._pending_segments(skip_existing):
+            task_queue.put(i)
+        self._task_queue = task_queue
+        num_workers = max(1, min(self.controller.maximum, task_queue.qsize()))
+        if self.options.get('hedge'):
+            self.hedge_executor = ThreadPoolExecutor(max_workers=num_workers * 2, thread_name_prefix=f"{self.movie_name}-hedge")
         threads = []
-        for start, end in intervals:
-            thread = threading.Thread(target=self._thread_task, args=(start, end, uuid, resolution, video_offset_max))
+        for n in range(num_workers):
+            thread = threading.Thread(target=self._worker, args=(task_queue,), name=f"{self.movie_name}-worker-{n}")
             threads.append(thread)
             thread.start()
         for thread in threads:
             thread.join()
-        self.counter.reset()
+        self._finish_download_segments()
+
+    def _finish_download_segments(self) -> None:
+        self.progress.stop()
+        if self.hedge_executor:
+            self.hedge_executor.shutdown(wait=False)
+            self.hedge_executor = None
+        self._task_queue = None
+        self.metrics.retries += self.retry_policy.retries_used
+        self.metrics.hedges_fired = self.latency.hedges_fired.get()
+        if self.options.get('hedge'):
+            logger.info(f"Hedged requests for {self.movie_name}: {self.latency.hedges_fired.get()} fired, {self.latency.hedges_won.get()} won.")
+        if self.retry_policy.budget_exhausted():
+            logger.error(f"Retry budget of {self.retry_policy.budget} exhausted for {self.movie_name}.")
+        if self.manifest:
+            self.manifest.save()
+        if self.assembler:
+            self.assembler.close()
 
-    def _check_integrity(self, video_offset_max: int) -> None:
-        downloaded_files = len([f for f in os.listdir(self.movie_folder) if f.endswith('.jpeg')])
-        total_files = video_offset_max + 1
+    def _check_integrity(self) -> bool:
+        if self.output:
+            downloaded_files = self.output.completed
+        elif self.assembler:
+            downloaded_files = self.assembler.written
+        else:
+            downloaded_files = len([f for f in os.listdir(self.movie_folder) if f.endswith('.jpeg')])
+        total_files = len(self.playlist)
+        self.metrics.segments_total = total_files
+        self.metrics.segments_complete = downloaded_files
         integrity = downloaded_files / total_files
         logger.info(f"File integrity for {self.movie_name}: {integrity:.2%} ({downloaded_files}/{total_files} files)")
+        return downloaded_files == total_files
 
-    def _assemble_video(self, video_offset_max: int) -> None:
-        if not self.options.get('write_action'):
-            return
+    def _output_file(self) -> str:
         self.final_file_name = f"{self.movie_name}_{self.final_quality}"
-        output_file = os.path.join(MOVIE_SAVE_PATH_ROOT, f"{self.final_file_name}.mp4")
-        if self.options.get('ffmpeg_action'):
-            segment_files = [os.path.join(self.movie_folder, f"video{i}.jpeg") for i in range(video_offset_max + 1) if os.path.exists(os.path.join(self.movie_folder, f"video{i}.jpeg"))]
-            cover_file = os.path.join(MOVIE_SAVE_PATH_ROOT, f"{self.movie_name}-cover.jpg") if self.options.get('cover_as_preview') and os.path.exists(os.path.join(MOVIE_SAVE_PATH_ROOT, f"{self.movie_name}-cover.jpg")) else None
-            FFmpegProcessor.create_video_from_segments(segment_files, output_file, cover_file)
-        else:
-            with open(output_file, 'wb') as outfile:
-                for i in range(video_offset_max + 1):
-                    file_path = os.path.join(self.movie_folder, f"video{i}.jpeg")
-                    if os.path.exists(file_path):
-                        with open(file_path, 'rb') as infile:
-                            outfile.write(infile.read())
-        if self.options.get('title_action') and self.title:
-            os.rename(output_file, os.path.join(MOVIE_SAVE_PATH_ROOT, f"{self.title}.mp4"))
+        return os.path.join(MOVIE_SAVE_PATH_ROOT, f"{self.final_file_name}.mp4")
 
-    def download(self) -> None:
-        if not self._fetch_metadata():
+    def _cover_file(self) -> Optional[str]:
+        cover_file = os.path.join(MOVIE_SAVE_PATH_ROOT, f"{self.movie_name}-cover.jpg")
+        return cover_file if self.options.get('cover_as_preview') and os.path.exists(cover_file) else None
+
+    def _start_assembler(self) -> None:
+        if not self.options.get('download_action') or not self.options.get('write_action') or self.options.get('resume'):
             return
-        playlist_url = f"{VIDEO_M3U8_PREFIX}{self.uuid}{VIDEO_PLAYLIST_SUFFIX}"
-        playlist = self.http_client.get(playlist_url)
-        if not playlist:
-            logger.error("Failed to fetch playlist.")
+        if self.options.get('ffmpeg_action') and self.options.get('ffmpeg_pipe'):
+            self.ffmpeg_process = FFmpegProcessor.start_pipe(self._output_file(), self._cover_file())
+            if self.ffmpeg_process:
+                self.assembler = StreamAssembler(self.ffmpeg_process.stdin, self.movie_folder, len(self.playlist))
+        elif self.options.get('stream') and not self.options.get('ffmpeg_action'):
+            self.assembler = StreamAssembler(open(self._output_file(), 'wb'), self.movie_folder, len(self.playlist))
+
+    def _segment_sizes(self) -> Optional[list[int]]:
+        sizes = [segment.byte_range[0] if segment.byte_range else None for segment in self.playlist]
+        unknown = [segment for segment, size in zip(self.playlist, sizes) if size is None]
+        timeout = self.options.get('timeout', 10)
+        policy = RetryPolicy(self.options.get('retry', 5), self.options.get('delay', 2))
+        if unknown:
+            logger.info(f"Probing the size of {len(unknown)} segments for {self.movie_name} with HEAD requests.")
+        with ThreadPoolExecutor(max_workers=self.http_client.pool_size) as executor:
+            probed = executor.map(lambda segment: self.http_client.content_length(segment.uri, timeout=timeout, policy=policy, request_counter=self.metrics.requests), unknown)
+            for segment, size in zip(unknown, probed):
+                sizes[segment.index] = size
+        failed = sum(1 for size in sizes if not size)
+        if failed:
+            logger.error(f"Failed to probe the size of {failed}/{len(unknown)} segments for {self.movie_name}")
+            return None
+        return sizes
+
+    def _start_preallocated_output(self, resolution: str) -> None:
+        if not self.options.get('download_action') or not self.options.get('write_action') or not self.options.get('preallocate') or self.options.get('ffmpeg_action'):
             return
-        playlist = playlist.decode('utf-8')
-        self.final_quality, resolution_url = self._get_final_quality_and_resolution(playlist)
-        if not self.final_quality:
+        output_file = self._output_file()
+        state_file = output_file + PREALLOC_STATE_SUFFIX
+        sizes = PreallocatedOutput.load_sizes(state_file, self.uuid, resolution)
+        if sizes is None or len(sizes) != len(self.playlist):
+            sizes = self._segment_sizes()
+        if sizes is None:
+            logger.error(f"Segment sizes unknown for {self.movie_name}, falling back to per-segment files.")
             return
-        video_m3u8_url = f"{VIDEO_M3U8_PREFIX}{self.uuid}/{resolution_url}"
-        video_m3u8 = self.http_client.get(video_m3u8_url)
-        if not video_m3u8:
-            logger.error("Failed to fetch video m3u8.")
+        self.output = PreallocatedOutput(output_file, state_file, self.uuid, resolution, sizes)
+        self.output.open()
+
+    def _finish_ffmpeg_pipe(self) -> bool:
+        if not self.ffmpeg_process:
+            return True
+        succeeded = FFmpegProcessor.finish_pipe(self.ffmpeg_process) and not self.assembler.failed
+        self.ffmpeg_process = None
+        if not succeeded:
+            logger.error(f"FFmpeg pipe failed for {self.movie_name}, falling back to the concat list.")
+            self.assembler = None
+        return succeeded
+
+    def _segment_files(self) -> list[str]:
+        segment_names = set(os.listdir(self.movie_folder))
+        return [os.path.join(self.movie_folder, f"video{i}.jpeg") for i in range(len(self.playlist)) if f"video{i}.jpeg" in segment_names]
+
+    def _assemble_video(self) -> None:
+        if not self.options.get('write_action'):
             return
-        video_m3u8 = video_m3u8.decode('utf-8')
-        video_offset_max_str = video_m3u8.splitlines()[-2]
-        video_offset_max = int(re.search(r'\d+', video_offset_max_str).group(0))
+        output_file = self._output_file()
+        if not self.assembler and not self.output:
+            if self.options.get('ffmpeg_action'):
+                FFmpegProcessor.create_video_from_segments(self._segment_files(), output_file, self._cover_file(), os.path.join(self.movie_folder, FFMPEG_INPUT_FILE))
+            else:
+                concat_files(output_file, self._segment_files())
+        if self.options.get('title_action') and self.title:
+            os.rename(output_file, os.path.join(MOVIE_SAVE_PATH_ROOT, f"{self.title}.mp4"))
+
+    def download(self) -> None:
+        self._snapshot('start')
+        with self.metrics.phase('metadata'):
+            if not self._fetch_metadata():
+                return
+        self._snapshot('metadata')
+        with self.metrics.phase('playlist'):
+            playlist_url = f"{self.m3u8_prefix}{self.uuid}{VIDEO_PLAYLIST_SUFFIX}"
+            playlist = self._fetch_playlist(playlist_url, 'playlist')
+            if not playlist:
+                logger.error("Failed to fetch playlist.")
+                return
+            self.final_quality, resolution_url = self._get_final_quality_and_resolution(playlist)
+            if not self.final_quality:
+                return
+            video_m3u8_url = f"{self.m3u8_prefix}{self.uuid}/{resolution_url}"
+            video_m3u8 = self._fetch_playlist(video_m3u8_url, resolution_url)
+            if not video_m3u8:
+                logger.error("Failed to fetch video m3u8.")
+                return
+            self.playlist = parse_media_playlist(video_m3u8, video_m3u8_url)
+            if not self.playlist.segments:
+                logger.error("No segments found in video m3u8.")
+                return
+        logger.info(f"Found {len(self.playlist)} segments ({self.playlist.duration / 60:.1f} minutes).")
         if not os.path.exists(self.movie_folder):
             os.makedirs(self.movie_folder)
+        resolution = resolution_url.split('/')[0]
+        if self.options.get('resume'):
+            self.manifest = SegmentManifest(self.movie_folder, self.uuid, resolution, len(self.playlist))
         self._download_cover()
-        self._download_segments(self.uuid, resolution_url.split('/')[0], video_offset_max)
-        self._check_integrity(video_offset_max)
-        self._assemble_video(video_offset_max)
+        with self.metrics.phase('segments'):
+            self._start_preallocated_output(resolution)
+            if not self.output:
+                self._start_assembler()
+            self._download_segments()
+            if not self._finish_ffmpeg_pipe():
+                self._download_segments(skip_existing=True)
+            complete = self._check_integrity()
+        self._snapshot('segments')
+        if self.output and not self.output.close():
+            raise Exception(f"{self.movie_name} is incomplete, keeping {self.output.part_file} for the next run.")
+        if self.manifest and not complete:
+            raise Exception(f"{self.movie_name} is incomplete, keeping {self.movie_folder} for the next run.")
+        with self.metrics.phase('assembly'):
+            self._assemble_video()
+        self._snapshot('assembly')
+        if self.manifest:
+            self.clean()
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from miyuki.download_history import DownloadHistory, normalize_movie_id
+
+
+class NormalizeMovieIdTest(unittest.TestCase):
+    def test_language_prefix_case_and_query_are_ignored(self):
+        for url in ['https://missav.ai/sw-950', 'https://missav.ai/ja/sw-950', 'https://missav.ai/en/SW-950/',
+                    'https://missav.ai/dm13/ja/sw-950?ref=home', ' https://missav.ai/sw-950#top\n']:
+            self.assertEqual(normalize_movie_id(url), 'sw-950', url)
+
+    def test_bare_ids_and_empty_paths(self):
+        self.assertEqual(normalize_movie_id('DANDY-917'), 'dandy-917')
+        self.assertEqual(normalize_movie_id('https://missav.ai/'), 'https://missav.ai/')
+
+
+class DownloadHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, 'history.db')
+        self.histories = []
+
+    def tearDown(self):
+        for history in self.histories:
+            history.close()
+        self._tmp.cleanup()
+
+    def open(self, **kwargs) -> DownloadHistory:
+        history = DownloadHistory(self.path, legacy_file=kwargs.pop('legacy_file', None), **kwargs)
+        self.histories.append(history)
+        return history
+
+    def stored(self) -> list[str]:
+        conn = sqlite3.connect(self.path)
+        try:
+            return sorted(row[0] for row in conn.execute('SELECT movie_id FROM downloads'))
+        finally:
+            conn.close()
+
+    def test_pending_records_are_visible_before_flush(self):
+        history = self.open(batch_size=10, flush_interval=60)
+        history.record_download('https://missav.ai/ja/sw-950', 'uuid')
+        self.assertEqual(self.stored(), [])
+        self.assertTrue(history.is_downloaded('https://missav.ai/SW-950?x=1'))
+        self.assertFalse(history.is_downloaded('https://missav.ai/sw-951'))
+
+    def test_full_batch_is_flushed(self):
+        history = self.open(batch_size=3, flush_interval=60)
+        for i in range(2):
+            history.record_download(f'https://missav.ai/abc-{i}')
+        self.assertEqual(self.stored(), [])
+        history.record_download('https://missav.ai/abc-2')
+        self.assertEqual(self.stored(), ['abc-0', 'abc-1', 'abc-2'])
+
+    def test_partial_batch_is_flushed_when_the_interval_expires(self):
+        history = self.open(batch_size=10, flush_interval=0.05)
+        history.record_download('https://missav.ai/abc-1')
+        deadline = time.monotonic() + 2
+        while not self.stored() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(self.stored(), ['abc-1'])
+
+    def test_close_flushes_and_later_records_are_refused(self):
+        history = self.open(batch_size=10, flush_interval=60)
+        history.record_download('https://missav.ai/abc-1')
+        history.close()
+        self.assertEqual(self.stored(), ['abc-1'])
+        with self.assertLogs('miyuki-logger', level='ERROR'):
+            history.record_download('https://missav.ai/abc-2')
+        history.close()
+        self.assertEqual(self.stored(), ['abc-1'])
+
+    def test_history_is_shared_between_instances(self):
+        first = self.open(batch_size=1)
+        first.record_download('https://missav.ai/en/abc-1')
+        self.assertTrue(self.open().is_downloaded('https://missav.ai/abc-1'))
+
+    def test_legacy_record_file_is_imported_once(self):
+        legacy_file = os.path.join(self._tmp.name, 'downloaded_urls_miyuki.txt')
+        with open(legacy_file, 'w', encoding='utf-8') as f:
+            f.write('https://missav.ai/sw-950\nhttps://missav.ai/ja/DANDY-917/\n\n')
+        history = self.open(legacy_file=legacy_file)
+        self.assertTrue(history.is_downloaded('https://missav.ai/ja/sw-950'))
+        self.assertTrue(history.is_downloaded('https://missav.ai/dandy-917'))
+        self.assertFalse(os.path.exists(legacy_file))
+        self.assertTrue(os.path.exists(legacy_file + '.imported'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from miyuki.m3u8_parser import parse_media_playlist
+
+BASE_URL = 'https://surrit.com/aaaa-bbbb/720p/video.m3u8'
+
+
+class ParseMediaPlaylistTest(unittest.TestCase):
+    def test_tags_after_endlist_are_ignored(self):
+        playlist = parse_media_playlist('\n'.join([
+            '#EXTM3U',
+            '#EXT-X-TARGETDURATION:4',
+            '#EXT-X-MEDIA-SEQUENCE:7',
+            '#EXTINF:4.000,',
+            'video0.jpeg',
+            '#EXTINF:2.500,',
+            'video1.jpeg',
+            '#EXT-X-ENDLIST',
+            '#EXT-X-DISCONTINUITY',
+            '',
+            '#EXT-X-PROGRAM-DATE-TIME:2024-01-01T00:00:00Z',
+            '',
+        ]), BASE_URL)
+        self.assertTrue(playlist.ended)
+        self.assertEqual(len(playlist), 2)
+        self.assertEqual(playlist.target_duration, 4.0)
+        self.assertEqual([segment.sequence for segment in playlist], [7, 8])
+        self.assertEqual([segment.duration for segment in playlist], [4.0, 2.5])
+        self.assertEqual(playlist[1].uri, 'https://surrit.com/aaaa-bbbb/720p/video1.jpeg')
+
+    def test_byte_range_offsets_continue_per_uri(self):
+        playlist = parse_media_playlist('\n'.join([
+            '#EXTM3U',
+            '#EXTINF:4.000,',
+            '#EXT-X-BYTERANGE:1000@0',
+            'main.ts',
+            '#EXTINF:4.000,',
+            '#EXT-X-BYTERANGE:500',
+            'main.ts',
+            '#EXTINF:4.000,',
+            '#EXT-X-BYTERANGE:300',
+            'other.ts',
+            '#EXTINF:4.000,',
+            '#EXT-X-BYTERANGE:200',
+            'main.ts',
+            '#EXTINF:4.000,',
+            '#EXT-X-BYTERANGE:100@50',
+            'other.ts',
+            '#EXTINF:4.000,',
+            'whole.ts',
+            '#EXT-X-ENDLIST',
+        ]), BASE_URL)
+        self.assertEqual([segment.byte_range for segment in playlist], [(1000, 0), (500, 1000), (300, 0), (200, 1500), (100, 50), None])
+        self.assertEqual(playlist[1].range_header(), {'Range': 'bytes=1000-1499'})
+        self.assertIsNone(playlist[5].range_header())
+
+    def test_relative_and_absolute_uris(self):
+        playlist = parse_media_playlist('\n'.join([
+            '#EXTM3U',
+            '#EXTINF:4.000,',
+            'video0.jpeg',
+            '#EXTINF:4.000,',
+            '../1080p/video1.jpeg',
+            '#EXTINF:4.000,',
+            '/cccc-dddd/video2.jpeg',
+            '#EXTINF:4.000,',
+            'https://cdn.example.com/video3.jpeg?token=abc',
+        ]), BASE_URL)
+        self.assertFalse(playlist.ended)
+        self.assertEqual([segment.uri for segment in playlist], [
+            'https://surrit.com/aaaa-bbbb/720p/video0.jpeg',
+            'https://surrit.com/aaaa-bbbb/1080p/video1.jpeg',
+            'https://surrit.com/cccc-dddd/video2.jpeg',
+            'https://cdn.example.com/video3.jpeg?token=abc',
+        ])
+        self.assertEqual([segment.index for segment in playlist], [0, 1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
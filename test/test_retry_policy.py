@@ -0,0 +1,70 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from miyuki.retry_policy import RetryPolicy, HttpStatusError, IncompleteContentError
+
+
+class StubResponse:
+    def __init__(self, status_code: int = 200, headers: dict = None, content: bytes = b''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+
+class RetryPolicyTest(unittest.TestCase):
+    def test_client_errors_fail_fast(self):
+        policy = RetryPolicy(5)
+        self.assertFalse(policy.should_retry(HttpStatusError(404), 0))
+        self.assertFalse(policy.should_retry(HttpStatusError(403), 0))
+        self.assertEqual(policy.retries_used, 0)
+
+    def test_throttling_and_server_errors_retry(self):
+        policy = RetryPolicy(5)
+        for status_code in [408, 429, 500, 503, 520]:
+            self.assertTrue(policy.should_retry(HttpStatusError(status_code), 0), status_code)
+        self.assertTrue(policy.should_retry(ConnectionError('reset'), 0))
+        self.assertFalse(policy.should_retry(HttpStatusError(503), 4))
+
+    def test_shared_budget_is_exhausted(self):
+        policy = RetryPolicy(5, budget=2)
+        self.assertTrue(policy.should_retry(HttpStatusError(503), 0))
+        self.assertTrue(policy.should_retry(HttpStatusError(503), 1))
+        self.assertTrue(policy.budget_exhausted())
+        self.assertFalse(policy.should_retry(HttpStatusError(503), 0))
+        self.assertEqual(policy.retries_used, 2)
+
+    def test_retry_after_seconds_and_http_date(self):
+        self.assertEqual(RetryPolicy._parse_retry_after(' 7 '), 7.0)
+        later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        self.assertAlmostEqual(RetryPolicy._parse_retry_after(later), 30, delta=2)
+        earlier = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=30), usegmt=True)
+        self.assertEqual(RetryPolicy._parse_retry_after(earlier), 0.0)
+        self.assertIsNone(RetryPolicy._parse_retry_after('soon'))
+        self.assertIsNone(RetryPolicy._parse_retry_after(None))
+
+    def test_retry_after_drives_backoff(self):
+        policy = RetryPolicy(5, base_delay=1, max_delay=10)
+        with self.assertRaises(HttpStatusError) as raised:
+            policy.check_status(StubResponse(429, {'Retry-After': '3'}))
+        self.assertEqual(raised.exception.retry_after, 3.0)
+        self.assertEqual(policy.backoff(raised.exception, 0), 3.0)
+        self.assertEqual(policy.backoff(HttpStatusError(429, 60.0), 0), 10)
+
+    def test_check_length(self):
+        policy = RetryPolicy()
+        policy.check_length(StubResponse(headers={'Content-Length': '10'}), 10)
+        with self.assertRaises(IncompleteContentError):
+            policy.check_length(StubResponse(headers={'Content-Length': '10'}), 4)
+        # curl decodes compressed bodies, so the received size never matches the encoded Content-Length.
+        policy.check_length(StubResponse(headers={'Content-Length': '10', 'Content-Encoding': 'gzip'}), 40)
+        policy.check_length(StubResponse(), 40)
+
+    def test_check_response(self):
+        policy = RetryPolicy()
+        policy.check_response(StubResponse(200, {'Content-Length': '3'}, b'abc'))
+        with self.assertRaises(IncompleteContentError):
+            policy.check_response(StubResponse(200, {'Content-Length': '5'}, b'abc'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import io
+import os
+import tempfile
+import unittest
+from miyuki.stream_assembler import StreamAssembler
+
+
+def segment(index: int) -> bytes:
+    return bytes([65 + index]) * 3
+
+
+class FailingSink(io.BytesIO):
+    def __init__(self, fail_at: int):
+        super().__init__()
+        self.fail_at = fail_at
+        self.writes = 0
+
+    def write(self, data) -> int:
+        self.writes += 1
+        if self.writes == self.fail_at:
+            raise OSError('broken pipe')
+        return super().write(data)
+
+
+class StreamAssemblerTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.folder = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_out_of_order_segments_are_written_in_order(self):
+        sink = io.BytesIO()
+        assembler = StreamAssembler(sink, self.folder, 4)
+        for index in [2, 0, 3, 1]:
+            assembler.submit(index, segment(index))
+        self.assertEqual(sink.getvalue(), b''.join(segment(i) for i in range(4)))
+        self.assertEqual(assembler.buffered_bytes, 0)
+        self.assertEqual(assembler.close(), 4)
+        self.assertFalse(assembler.failed)
+
+    def test_segments_past_memory_budget_spill_to_disk(self):
+        sink = io.BytesIO()
+        assembler = StreamAssembler(sink, self.folder, 3, memory_budget=4)
+        assembler.submit(2, segment(2))
+        assembler.submit(1, segment(1))
+        self.assertEqual(assembler.buffered_bytes, 3)
+        self.assertEqual(os.listdir(self.folder), ['video1.jpeg'])
+        assembler.submit(0, segment(0))
+        self.assertEqual(sink.getvalue(), segment(0) + segment(1) + segment(2))
+        self.assertEqual(os.listdir(self.folder), [])
+        self.assertEqual(assembler.close(), 3)
+
+    def test_skipped_segments_leave_a_gap(self):
+        sink = io.BytesIO()
+        assembler = StreamAssembler(sink, self.folder, 4)
+        assembler.submit(3, segment(3))
+        assembler.skip(0)
+        assembler.submit(1, segment(1))
+        self.assertEqual(sink.getvalue(), segment(1))
+        assembler.skip(2)
+        self.assertEqual(sink.getvalue(), segment(1) + segment(3))
+        self.assertEqual(assembler.next_index, 4)
+        self.assertEqual(assembler.close(), 2)
+
+    def test_failed_sink_spills_the_remaining_segments(self):
+        sink = FailingSink(fail_at=2)
+        assembler = StreamAssembler(sink, self.folder, 4)
+        assembler.submit(0, segment(0))
+        assembler.submit(2, segment(2))
+        assembler.submit(1, segment(1))
+        self.assertTrue(assembler.failed)
+        self.assertEqual(sink.getvalue(), segment(0))
+        assembler.submit(3, segment(3))
+        self.assertEqual(sorted(os.listdir(self.folder)), ['video1.jpeg', 'video2.jpeg', 'video3.jpeg'])
+        with open(os.path.join(self.folder, 'video1.jpeg'), 'rb') as f:
+            self.assertEqual(f.read(), segment(1))
+        self.assertEqual(assembler.close(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()